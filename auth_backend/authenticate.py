@@ -1,27 +1,43 @@
+import hashlib
+import time
+from uuid import UUID
 from fastapi.security import OAuth2PasswordBearer
 
 from settings import settings
 from db.db_config import get_db
-from utils.hasher import check_hash
+from utils.hasher import hash_service
 from datetime import timedelta, datetime
 from fastapi import HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
-from db.db_services import UserManager
-from models import AuthUser, UserToken
+from storage import UserManager
+from models import AuthUser
+from utils.ttl_cache import TTLCache
 from jose import JWTError, jwt
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login/token")
 
+CLAIMS_VERSION = 1
 
-async def authenticate(data: AuthUser, db: AsyncSession) -> tuple[bool, str]:
+token_cache = TTLCache(settings.TOKEN_CACHE_SIZE, settings.REFRESH_TOKEN_EXPIRES_IN * 60)
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+async def authenticate(data: AuthUser, db: AsyncSession) -> tuple[dict, str]:
+    # returns the checked row, so tokens are issued from it rather than from the cached principal
     manager = UserManager(db)
     user = await manager.get(data)
     if user:
-        flag = check_hash(data.password, user.get('password'))
-        return flag, 'Ok' if flag else 'Invalid password'
+        if await hash_service.check_hash(data.password, user.pop('password')):
+            return user, 'Ok'
+        return {}, 'Invalid password'
     else:
-        return False, 'Invalid email'
+        return {}, 'Invalid email'
 
 
 def create_token(data: dict,
@@ -43,16 +59,39 @@ def create_refresh_token(data: dict,
 
 
 def decode_token(token: str):
-    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=settings.ALGORITHM)
-    return payload
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is None:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=settings.ALGORITHM)
+        ttl = payload['exp'] - time.time() if 'exp' in payload else None
+        if ttl is None or ttl > 0:
+            token_cache.set(digest, payload, ttl)
+    return dict(payload)
+
+
+def user_claims(user: dict) -> dict:
+    return {
+        'sub': user.get('email'),
+        'uid': str(user.get('user_id')),
+        'adm': bool(user.get('is_admin')),
+        'tv': user.get('token_version'),
+        'ver': CLAIMS_VERSION,
+    }
+
+
+def principal_from_claims(payload: dict) -> dict:
+    try:
+        return {
+            'email': payload['sub'],
+            'user_id': UUID(payload['uid']),
+            'is_admin': bool(payload['adm']),
+            'token_version': int(payload['tv']),
+        }
+    except (KeyError, TypeError, ValueError):
+        raise credentials_exception
 
 
 async def get_user_from_token(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> dict:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
     try:
         payload = decode_token(token)
         email = payload.get('sub')
@@ -60,10 +99,13 @@ async def get_user_from_token(token: str = Depends(oauth2_scheme), db: AsyncSess
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = UserToken(email=email)
     manager = UserManager(db)
-    user_data = await manager.get(user)
+    if payload.get('ver') == CLAIMS_VERSION:
+        principal = principal_from_claims(payload)
+        if await manager.get_token_version(email) != principal.get('token_version'):  # revoked
+            raise credentials_exception
+        return principal
+    user_data = await manager.get_principal(email)
     if not user_data:
         raise credentials_exception
-    user_data.pop('password')
     return user_data
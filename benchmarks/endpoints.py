@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Awaitable, Callable
+import httpx
+from main import app
+
+PASSWORD = 'Qwerty1234'
+SCENARIOS = ('register', 'login', 'list', 'filter', 'read', 'like_cycle')
+
+
+def percentile(latencies: list[float], rank: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(int(len(ordered) * rank), len(ordered) - 1)]
+
+
+def summarise(latencies: list[float], errors: int, elapsed: float) -> dict:
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50': round(percentile(latencies, .50) * 1000, 2),
+        'p95': round(percentile(latencies, .95) * 1000, 2),
+        'p99': round(percentile(latencies, .99) * 1000, 2),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def __call__(self, endpoint: str, request: Awaitable[httpx.Response]) -> httpx.Response:
+        started = time.perf_counter()
+        response = await request
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+        return response
+
+
+async def register(client: httpx.AsyncClient, email: str) -> None:
+    await client.post('/reg', json={'first_name': 'bench', 'last_name': 'bench', 'email': email, 'password': PASSWORD})
+
+
+async def login(client: httpx.AsyncClient, email: str) -> dict:
+    response = await client.post('/login/token', data={'username': email, 'password': PASSWORD})
+    response.raise_for_status()
+    return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+async def prepare(client: httpx.AsyncClient, posts: int) -> dict:
+    run = uuid.uuid4().hex[:8]
+    owner, rater = f'owner{run}@example.com', f'rater{run}@example.com'
+    await register(client, owner)
+    await register(client, rater)
+    owner_headers = await login(client, owner)
+    for i in range(posts):
+        response = await client.post('/post', json={'title': f'bench {i}', 'content': f'bench content {i}'},
+                                     headers=owner_headers)
+        response.raise_for_status()
+    post_ids, cursor = [], None
+    while len(post_ids) < posts:
+        params = {'limit': min(posts - len(post_ids), 100), **({'cursor': cursor} if cursor else {})}
+        response = await client.get('/post/filter', params=params, headers=owner_headers)
+        response.raise_for_status()
+        post_ids.extend(post['post_id'] for post in response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    return {'run': run, 'owner': owner, 'headers': await login(client, rater), 'post_ids': post_ids}
+
+
+def scenario(name: str, client: httpx.AsyncClient, state: dict, record: Recorder) -> Callable[[int], Awaitable]:
+    headers, post_ids = state['headers'], state['post_ids']
+    if name == 'register':
+        return lambda i: record(name, client.post('/reg', json={
+            'first_name': 'bench', 'last_name': 'bench', 'email': f'user{state["run"]}{i}@example.com',
+            'password': PASSWORD
+        }))
+    if name == 'login':
+        return lambda i: record(name, client.post('/login/token', data={'username': state['owner'],
+                                                                         'password': PASSWORD}))
+    if name == 'list':
+        return lambda i: record(name, client.get('/post', headers=headers))
+    if name == 'filter':
+        return lambda i: record(name, client.get('/post/filter', params={'page': i % 5, 'limit': 20},
+                                                 headers=headers))
+    if name == 'read':
+        return lambda i: record(name, client.get(f'/post/{post_ids[i % len(post_ids)]}', headers=headers))
+
+    async def like_cycle(i: int) -> None:
+        # a worker always gets the same i modulo concurrency, so concurrent cycles never touch the same post
+        post_id = post_ids[i % state['concurrency']]
+        await record('like', client.post(f'/post/{post_id}/like', headers=headers))
+        await record('unlike', client.delete(f'/post/{post_id}/like', headers=headers))
+        await record('dislike', client.post(f'/post/{post_id}/dis', headers=headers))
+        await record('undislike', client.delete(f'/post/{post_id}/dis', headers=headers))
+    return like_cycle
+
+
+async def drive(call: Callable[[int], Awaitable], requests: int, concurrency: int) -> float:
+    counter = itertools.count()
+
+    async def worker(offset: int) -> None:
+        for i in itertools.count(offset, concurrency):
+            if next(counter) >= requests:
+                return
+            await call(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def run(scenarios: list[str], requests: int, concurrency: int, posts: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=60) as client:
+            state = await prepare(client, max(posts, concurrency))
+            state['concurrency'] = concurrency
+            results = {}
+            for name in scenarios:
+                record = Recorder()
+                elapsed = await drive(scenario(name, client, state, record), requests, concurrency)
+                for endpoint, latencies in record.latencies.items():
+                    results[endpoint] = summarise(latencies, record.errors[endpoint], elapsed)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for endpoint, result in results.items():
+        base = baseline.get(endpoint)
+        if not base:
+            continue
+        for key in ('p50', 'p95', 'p99'):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f'{endpoint} {key}: {result[key]}ms > {base[key]}ms')
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f'{endpoint} throughput: {result["throughput"]}/s < {base["throughput"]}/s')
+        if result['errors'] > base['errors']:
+            regressions.append(f'{endpoint} errors: {result["errors"]} > {base["errors"]}')
+    return regressions
+
+
+def report(results: dict) -> None:
+    print(f'{"endpoint":<12}{"requests":>10}{"errors":>8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for endpoint, r in results.items():
+        print(f'{endpoint:<12}{r["requests"]:>10}{r["errors"]:>8}{r["throughput"]:>10}'
+              f'{r["p50"]:>10}{r["p95"]:>10}{r["p99"]:>10}')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Drive main.app in-process and report latency per endpoint')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--posts', type=int, default=100)
+    parser.add_argument('--baseline', default='benchmarks/baseline.json')
+    parser.add_argument('--tolerance', type=float, default=.2)
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    args = parser.parse_args()
+    results = asyncio.run(run(args.scenarios, args.requests, args.concurrency, args.posts))
+    report(results)
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        return 0
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        # latencies depend on the machine, so the baseline is recorded where the gate runs instead of committed
+        print(f'no baseline at {args.baseline}, nothing was checked; run with --save on this machine to record one')
+        return 1
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
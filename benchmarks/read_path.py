@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import time
+from fastapi.encoders import jsonable_encoder
+import orjson
+from sqlalchemy import select, insert, func, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from db.db_schema import Post, User
+from db.db_services import POST_COLUMNS
+from settings import settings
+
+
+async def seed(session, rows: int) -> None:
+    total = await session.scalar(select(func.count()).select_from(Post))
+    if total >= rows:
+        return
+    user_id = await session.scalar(insert(User).values(
+        first_name='bench', last_name='bench', password='-', email=f'bench{total}@example.com'
+    ).returning(User.user_id))
+    for start in range(total, rows, 10000):
+        await session.execute(insert(Post), [
+            {'title': f'bench title {i}', 'content': f'bench content {i} ' * 10, 'owner_id': user_id,
+             'modify_id': user_id} for i in range(start, min(start + 10000, rows))
+        ])
+    await session.commit()
+
+
+async def orm_read(session, rows: int) -> bytes:
+    # the read path before the column projection
+    result = await session.execute(select(Post).limit(rows))
+    posts = [post.__dict__ for post in result.scalars()]
+    for post in posts:
+        post.pop('_sa_instance_state', None)
+    body = json.dumps(jsonable_encoder(posts)).encode()
+    session.expunge_all()
+    return body
+
+
+async def projected_read(session, rows: int) -> bytes:
+    result = await session.execute(select(*POST_COLUMNS).limit(rows))
+    posts = [dict(post) for post in result.mappings()]
+    return orjson.dumps(posts)
+
+
+async def measure(session_maker, read, rows: int, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        async with session_maker() as session:
+            started = time.perf_counter()
+            await read(session, rows)
+            best = min(best, time.perf_counter() - started)
+    return rows / best
+
+
+async def main(url: str, rows: int, repeat: int) -> None:
+    engine = create_async_engine(url)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        await seed(session, rows)
+        await session.execute(text('ANALYZE post'))
+    before = await measure(session_maker, orm_read, rows, repeat)
+    after = await measure(session_maker, projected_read, rows, repeat)
+    await engine.dispose()
+    print(f'rows: {rows}, best of {repeat}')
+    print(f'orm + jsonable_encoder: {before:,.0f} rows/s')
+    print(f'projected + orjson:     {after:,.0f} rows/s ({after / before:.1f}x)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the ORM and the column-projected post read paths')
+    parser.add_argument('--url', default=settings.DB_TEST)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.rows, args.repeat))
@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator
+import asyncpg
+import bcrypt
+from redis import asyncio as aioredis
+from cache_redis.cache import rate_key
+
+PASSWORD = 'Qwerty1234'
+BASE_TIME = datetime(2023, 1, 1)
+WORDS = ('post', 'fast', 'api', 'redis', 'cache', 'index', 'query', 'async', 'user', 'like', 'share', 'feed',
+         'news', 'social', 'network', 'python', 'tuning', 'latency', 'scale', 'viral')
+BCRYPT_ALPHABET = './ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+CHUNK = 10000
+
+
+def fixed_salt(rng: random.Random) -> bytes:
+    # the last of the 22 salt characters only carries two bits
+    body = ''.join(rng.choice(BCRYPT_ALPHABET) for _ in range(21)) + rng.choice('.Oeu')
+    return f'$2b$12${body}'.encode()
+
+
+def user_id(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def email(i: int) -> str:
+    return f'user{i}@example.com'
+
+
+def user_rows(rng: random.Random, users: int, password: str) -> Iterator[tuple]:
+    for i in range(users):
+        yield user_id(rng), 'Seed', 'User', password, email(i), False, 0
+
+
+def post_rows(rng: random.Random, posts: int, owners: list[int], user_ids: list[uuid.UUID]) -> Iterator[tuple]:
+    created_at = BASE_TIME
+    for i in range(posts):
+        created_at += timedelta(seconds=rng.randint(1, 120))
+        owner = user_ids[owners[i]]
+        content = ' '.join(rng.choices(WORDS, k=rng.randint(10, 60)))
+        yield i + 1, f'Post {i + 1} {rng.choice(WORDS)}', content, created_at, created_at, owner, owner
+
+
+def reaction_counts(rng: random.Random, posts: int, users: int, reactions: int, skew: float) -> list[int]:
+    # Zipf weights over a shuffled rank, so the viral posts are spread over the id range
+    ranks = list(range(1, posts + 1))
+    rng.shuffle(ranks)
+    weights = [1 / rank ** skew for rank in ranks]
+    scale = reactions / sum(weights)
+    return [min(round(weight * scale), users - 1) for weight in weights]
+
+
+async def truncate(conn: asyncpg.Connection, r: aioredis.Redis) -> None:
+    await conn.execute('TRUNCATE "like", dislike, post, "user" RESTART IDENTITY CASCADE')
+    for pattern in ('likes:*:set', 'dis:*:set', 'post:*'):
+        keys = [key async for key in r.scan_iter(match=pattern, count=CHUNK)]
+        for start in range(0, len(keys), CHUNK):
+            await r.delete(*keys[start:start + CHUNK])
+
+
+async def load_reactions(conn: asyncpg.Connection, r: aioredis.Redis, rng: random.Random, counts: list[int],
+                         owners: list[int], users: int, dislike_ratio: float) -> int:
+    total = 0
+    for start in range(0, len(counts), CHUNK):
+        likes, dislikes = [], []
+        async with r.pipeline(transaction=False) as pipe:
+            for post_id in range(start + 1, min(start + CHUNK, len(counts)) + 1):
+                count = counts[post_id - 1]
+                if not count:
+                    continue
+                reviewers = [i for i in rng.sample(range(users), count + 1) if i != owners[post_id - 1]][:count]
+                rated = {'likes': [], 'dis': []}
+                for reviewer in reviewers:
+                    rate_type = 'dis' if rng.random() < dislike_ratio else 'likes'
+                    rated[rate_type].append(email(reviewer))
+                likes.extend((reviewer, post_id) for reviewer in rated['likes'])
+                dislikes.extend((reviewer, post_id) for reviewer in rated['dis'])
+                for rate_type, emails in rated.items():
+                    if emails:
+                        pipe.sadd(rate_key(rate_type, post_id), *emails)
+            await conn.copy_records_to_table('like', records=likes, columns=['reviewer', 'post_id'])
+            await conn.copy_records_to_table('dislike', records=dislikes, columns=['reviewer', 'post_id'])
+            await pipe.execute()
+        total += len(likes) + len(dislikes)
+    return total
+
+
+async def seed(url: str, redis_host: str, redis_port: int, users: int, posts: int, reactions: int, skew: float,
+               dislike_ratio: float, seed_value: int) -> None:
+    rng = random.Random(seed_value)
+    conn = await asyncpg.connect(url.replace('postgresql+asyncpg://', 'postgresql://'))
+    r = aioredis.Redis(host=redis_host, port=redis_port, decode_responses=True)
+    started = time.perf_counter()
+    try:
+        await truncate(conn, r)
+        password = bcrypt.hashpw(PASSWORD.encode(), fixed_salt(rng)).decode()
+        user_ids = [row[0] for row in user_rows(random.Random(seed_value + 1), users, password)]
+        await conn.copy_records_to_table(
+            'user', records=user_rows(random.Random(seed_value + 1), users, password),
+            columns=['user_id', 'first_name', 'last_name', 'password', 'email', 'is_admin', 'token_version']
+        )
+        owners = [rng.randrange(users) for _ in range(posts)]
+        await conn.copy_records_to_table(
+            'post', records=post_rows(rng, posts, owners, user_ids),
+            columns=['post_id', 'title', 'content', 'created_at', 'update_at', 'owner_id', 'modify_id']
+        )
+        await conn.execute("SELECT setval(pg_get_serial_sequence('post', 'post_id'), GREATEST($1, 1))", posts)
+        counts = reaction_counts(rng, posts, users, reactions, skew)
+        total = await load_reactions(conn, r, rng, counts, owners, users, dislike_ratio)
+        await conn.execute(
+            'UPDATE post SET '
+            'likes_count = (SELECT count(*) FROM "like" WHERE "like".post_id = post.post_id), '
+            'dislikes_count = (SELECT count(*) FROM dislike WHERE dislike.post_id = post.post_id)'
+        )
+        await conn.execute('ANALYZE')
+    finally:
+        await conn.close()
+        await r.close()
+    print(f'users: {users:,}, posts: {posts:,}, reactions: {total:,} (max {max(counts, default=0):,} on one post) '
+          f'in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replace the database and rating sets with a reproducible dataset')
+    parser.add_argument('--url', required=True, help='database to wipe, never defaults to the application one')
+    parser.add_argument('--redis-host', required=True)
+    parser.add_argument('--redis-port', type=int, default=6379)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--reactions', type=int, default=1000000)
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of reactions per post, 0 is uniform')
+    parser.add_argument('--dislike-ratio', type=float, default=.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--yes', action='store_true', help='confirm that the database and rating sets are replaced')
+    args = parser.parse_args()
+    if not args.yes:
+        parser.error(f'this truncates every table of {args.url} and deletes the rating keys on {args.redis_host}, '
+                     f'pass --yes to confirm')
+    asyncio.run(seed(args.url, args.redis_host, args.redis_port, args.users, args.posts, args.reactions, args.skew,
+                     args.dislike_ratio, args.seed))
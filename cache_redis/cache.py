@@ -1,29 +1,233 @@
-import redis
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import UUID
+import orjson
+from redis import asyncio as aioredis
+from redis.commands.core import AsyncScript
 from settings import settings
+from utils.metrics import timed_redis
 
 
-r = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, decode_responses=True)
+pool: Optional[aioredis.BlockingConnectionPool] = None
+r: Optional[aioredis.Redis] = None
+# cached posts are orjson bytes, they are read through a pool that leaves replies undecoded
+raw_pool: Optional[aioredis.BlockingConnectionPool] = None
+raw: Optional[aioredis.Redis] = None
 
+OPPOSITE_RATE = {'likes': 'dis', 'dis': 'likes'}
 
-def add_rate(rate_type: str, post_id: int, email: str) -> int:
-    added = r.sadd(f'{rate_type}:{str(post_id)}:set', email)
+# KEYS: rate set, opposite rate set, optional write-behind stream;
+# ARGV: email, 1 to add or 0 to remove, rate type, post id.
+# Returns {-1, total} when the opposite rate exists, otherwise {changed, total}.
+RATE_SCRIPT = """
+local changed
+if ARGV[2] == '1' then
+    if redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 1 then
+        return {-1, redis.call('SCARD', KEYS[1])}
+    end
+    changed = redis.call('SADD', KEYS[1], ARGV[1])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[1])
+end
+if changed == 1 and KEYS[3] then
+    redis.call('XADD', KEYS[3], '*', 'rate', ARGV[3], 'post_id', ARGV[4], 'email', ARGV[1], 'add', ARGV[2])
+end
+return {changed, redis.call('SCARD', KEYS[1])}
+"""
+# Registered once: the sha is computed here and the script is loaded on the first NOSCRIPT reply of a server.
+rate_script = AsyncScript(None, RATE_SCRIPT.encode())
+
+# KEYS: post version, likes set, dislikes set; ARGV: post data key prefix.
+# Returns {version, data or nil, total likes, total dislikes}.
+POST_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+return {version, redis.call('GET', ARGV[1] .. version), redis.call('SCARD', KEYS[2]), redis.call('SCARD', KEYS[3])}
+"""
+post_script = AsyncScript(None, POST_SCRIPT.encode())
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def connection_pool(decode_responses: bool) -> aioredis.BlockingConnectionPool:
+    return aioredis.BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        max_connections=settings.REDIS_POOL_SIZE,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        decode_responses=decode_responses
+    )
+
+
+def open_pool() -> aioredis.Redis:
+    global pool, r, raw_pool, raw
+    pool, raw_pool = connection_pool(True), connection_pool(False)
+    r, raw = aioredis.Redis(connection_pool=pool), aioredis.Redis(connection_pool=raw_pool)
+    return r
+
+
+async def close_pool() -> None:
+    global pool, r, raw_pool, raw
+    for client in (r, raw):
+        if client is not None:
+            await client.close()
+    for connections in (pool, raw_pool):
+        if connections is not None:
+            await connections.disconnect()
+    pool, r, raw_pool, raw = None, None, None, None
+
+
+@timed_redis
+async def add_rate(rate_type: str, post_id: int, email: str) -> int:
+    added = await r.sadd(f'{rate_type}:{str(post_id)}:set', email)
     return added
 
 
-def remove_rate(rate_type: str, post_id: int, email: str):
-    r.srem(f'{rate_type}:{str(post_id)}:set', email)
+@timed_redis
+async def remove_rate(rate_type: str, post_id: int, email: str):
+    await r.srem(f'{rate_type}:{str(post_id)}:set', email)
 
 
-def show_reviewers(rate_type: str, post_id: int) -> set:
-    result = r.smembers(f'{rate_type}:{str(post_id)}:set')
+@timed_redis
+async def show_reviewers(rate_type: str, post_id: int) -> set:
+    result = await r.smembers(f'{rate_type}:{str(post_id)}:set')
     return result
 
 
-def check_exists_rate(rate_type: str, post_id: int, email: str) -> bool:
-    is_member = r.sismember(f'{rate_type}:{str(post_id)}:set', email)
+@timed_redis
+async def check_exists_rate(rate_type: str, post_id: int, email: str) -> bool:
+    is_member = await r.sismember(f'{rate_type}:{str(post_id)}:set', email)
     return is_member
 
 
-def get_rate(rate_type: str, post_id: int) -> int:
-    length = r.scard(f'{rate_type}:{post_id}:set')
+@timed_redis
+async def get_rate(rate_type: str, post_id: int) -> int:
+    length = await r.scard(f'{rate_type}:{post_id}:set')
     return length
+
+
+def rate_key(rate_type: str, post_id: int) -> str:
+    return f'{rate_type}:{post_id}:set'
+
+
+@timed_redis
+async def apply_rate(rate_type: str, post_id: int, email: str, add: bool,
+                     stream: Optional[str] = None) -> tuple[int, int]:
+    keys = [rate_key(rate_type, post_id), rate_key(OPPOSITE_RATE[rate_type], post_id)]
+    if stream:
+        keys.append(stream)
+    changed, total = await rate_script(keys=keys, args=[email, int(add), rate_type, post_id], client=r)
+    return changed, total
+
+
+@timed_redis
+async def get_rates(post_ids: list[int]) -> dict[int, dict]:
+    async with r.pipeline(transaction=False) as pipe:
+        for post_id in post_ids:
+            pipe.scard(rate_key('likes', post_id))
+            pipe.scard(rate_key('dis', post_id))
+        replies = iter(await pipe.execute())
+    return {post_id: {'total_likes': next(replies), 'total_dislikes': next(replies)} for post_id in post_ids}
+
+
+@timed_redis
+async def scan_reviewers(rate_type: str, post_id: int, cursor: int, count: int) -> tuple[int, list[str]]:
+    # count is a hint: hashtable sets return about count members, a listpack set (at most 128) comes back whole
+    next_cursor, reviewers = await r.sscan(rate_key(rate_type, post_id), cursor=cursor, count=count)
+    return next_cursor, reviewers
+
+
+class RateCache(ABC):
+
+    @abstractmethod
+    async def apply_rate(self, rate_type: str, post_id: int, email: str, add: bool,
+                         stream: Optional[str] = None) -> tuple[int, int]:
+        pass
+
+    @abstractmethod
+    async def get_rates(self, post_ids: list[int]) -> dict[int, dict]:
+        pass
+
+    @abstractmethod
+    async def scan_reviewers(self, rate_type: str, post_id: int, cursor: int, count: int) -> tuple[int, list[str]]:
+        pass
+
+
+class RedisRateCache(RateCache):
+
+    async def apply_rate(self, rate_type: str, post_id: int, email: str, add: bool,
+                         stream: Optional[str] = None) -> tuple[int, int]:
+        return await apply_rate(rate_type, post_id, email, add, stream)
+
+    async def get_rates(self, post_ids: list[int]) -> dict[int, dict]:
+        return await get_rates(post_ids)
+
+    async def scan_reviewers(self, rate_type: str, post_id: int, cursor: int, count: int) -> tuple[int, list[str]]:
+        return await scan_reviewers(rate_type, post_id, cursor, count)
+
+
+def post_cache_enabled() -> bool:
+    return r is not None and raw is not None and settings.POST_CACHE_TTL > 0
+
+
+def version_ttl() -> int:
+    # outlives every entry cached under the version, also one refilled from a read that raced the bump,
+    # so an expired version restarting at 0 never finds a stale entry
+    return 2 * settings.POST_CACHE_TTL
+
+
+def pack_post(post: dict) -> bytes:
+    return orjson.dumps([
+        post['post_id'],
+        post['title'],
+        post['content'],
+        (post['created_at'] - EPOCH) // timedelta(microseconds=1),
+        (post['update_at'] - EPOCH) // timedelta(microseconds=1),
+        post['owner_id'],
+        post['modify_id'],
+    ])
+
+
+def unpack_post(data: bytes) -> dict:
+    post_id, title, content, created_at, update_at, owner_id, modify_id = orjson.loads(data)
+    return {
+        'post_id': post_id,
+        'title': title,
+        'content': content,
+        'created_at': EPOCH + timedelta(microseconds=created_at),
+        'update_at': EPOCH + timedelta(microseconds=update_at),
+        'owner_id': UUID(owner_id),
+        'modify_id': UUID(modify_id),
+    }
+
+
+@timed_redis
+async def get_cached_post(post_id: int) -> tuple[int, Optional[dict], int, int]:
+    keys = [f'post:{post_id}:version', rate_key('likes', post_id), rate_key('dis', post_id)]
+    args = [f'post:{post_id}:v']
+    version, data, likes, dislikes = await post_script(keys=keys, args=args, client=raw)
+    post = None
+    if data:
+        try:
+            post = unpack_post(data)
+        except (ValueError, TypeError):
+            # an entry of an older format or a corrupt one is dropped, the caller refills it from the database
+            await r.delete(f'post:{post_id}:v{int(version)}')
+    return int(version), post, likes, dislikes
+
+
+@timed_redis
+async def cache_post(post_id: int, version: int, post: dict) -> None:
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.set(f'post:{post_id}:v{version}', pack_post(post), ex=settings.POST_CACHE_TTL)
+        pipe.expire(f'post:{post_id}:version', version_ttl())
+        await pipe.execute()
+
+
+@timed_redis
+async def bump_post_version(*post_ids: int) -> None:
+    async with r.pipeline(transaction=False) as pipe:
+        for post_id in post_ids:
+            pipe.incr(f'post:{post_id}:version')
+            pipe.expire(f'post:{post_id}:version', version_ttl())
+        await pipe.execute()
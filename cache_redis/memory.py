@@ -0,0 +1,39 @@
+from typing import Optional
+from cache_redis.cache import RateCache, OPPOSITE_RATE
+
+
+class MemoryRateCache(RateCache):
+    __slots__ = 'sets'
+
+    def __init__(self):
+        self.sets: dict[tuple[str, int], set[str]] = {}
+
+    def clear(self) -> None:
+        self.sets.clear()
+
+    def members(self, rate_type: str, post_id: int) -> set[str]:
+        return self.sets.get((rate_type, post_id), set())
+
+    async def apply_rate(self, rate_type: str, post_id: int, email: str, add: bool,
+                         stream: Optional[str] = None) -> tuple[int, int]:
+        members = self.sets.setdefault((rate_type, post_id), set())
+        if add:
+            if email in self.members(OPPOSITE_RATE[rate_type], post_id):
+                return -1, len(members)
+            changed = int(email not in members)
+            members.add(email)
+        else:
+            changed = int(email in members)
+            members.discard(email)
+        return changed, len(members)
+
+    async def get_rates(self, post_ids: list[int]) -> dict[int, dict]:
+        return {post_id: {'total_likes': len(self.members('likes', post_id)),
+                          'total_dislikes': len(self.members('dis', post_id))} for post_id in post_ids}
+
+    async def scan_reviewers(self, rate_type: str, post_id: int, cursor: int, count: int) -> tuple[int, list[str]]:
+        # the cursor is an offset into the sorted members, 0 once the set is exhausted like SSCAN
+        members = sorted(self.members(rate_type, post_id))
+        page = members[cursor:cursor + count]
+        next_cursor = cursor + count if cursor + count < len(members) else 0
+        return next_cursor, page
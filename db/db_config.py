@@ -1,11 +1,116 @@
-from typing import Generator
+import time
+from contextvars import ContextVar
+from typing import Generator, Optional
 from fastapi import HTTPException
-from sqlalchemy.exc import IntegrityError
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from cache_redis.cache import post_cache_enabled, bump_post_version
 from settings import settings
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from utils.metrics import db_queries, db_errors
+from utils.request_stats import record_db
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
 
-engine = create_async_engine(settings.DB, echo=True)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# Time spent opening new connections inside the current checkout, None outside of one.
+connecting: ContextVar[Optional[float]] = ContextVar('connecting', default=None)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    checkouts = 0
+    timeouts = 0
+    wait_total = 0.0
+    wait_max = 0.0
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        self.max_overflow = max_overflow
+
+    def _do_get(self):
+        # only the wait for a free connection counts, opening a new one is not pool contention
+        if connecting.get() is not None:  # QueuePool retries by calling itself
+            return super()._do_get()
+        started = time.perf_counter()
+        token = connecting.set(0.0)
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - started - connecting.get()
+            connecting.reset(token)
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            if connecting.get() is not None:
+                connecting.set(connecting.get() + time.perf_counter() - started)
+
+
+def create_engine(url: str, **kwargs) -> AsyncEngine:
+    options = dict(
+        echo=settings.DB_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args={'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE},
+    )
+    options.update(kwargs)
+    return create_async_engine(url, **options)
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    pool = engine.pool
+    capacity = pool.size() + max(pool.max_overflow, 0)
+    return {
+        'size': pool.size(),
+        'max_overflow': pool.max_overflow,
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+        'saturation': pool.checkedout() / capacity if capacity else 0.0,
+        'checkouts': pool.checkouts,
+        'timeouts': pool.timeouts,
+        'wait_avg': pool.wait_total / pool.checkouts if pool.checkouts else 0.0,
+        'wait_max': pool.wait_max,
+    }
+
+
+def statement_type(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'EMPTY'
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info.pop('query_started')
+        db_queries.observe(statement_type(statement), value=duration)
+        record_db(duration)
+
+    @event.listens_for(engine.sync_engine, 'handle_error')
+    def handle_error(context):
+        db_errors.inc(statement_type(context.statement or ''))
+
+
+engine = create_engine(settings.DB)
+instrument_engine(engine)
+if settings.STORAGE_BACKEND == 'memory':
+    from db.memory import MemorySession as async_session
+else:
+    async_session = async_sessionmaker(engine, expire_on_commit=False)
 
 
 async def get_db() -> Generator:
@@ -17,3 +122,15 @@ async def get_db() -> Generator:
         raise HTTPException(status_code=409, detail='User already exists')
     finally:
         await session.close()
+        await drop_stale_posts(session)
+
+
+async def drop_stale_posts(session: AsyncSession) -> None:
+    # the versions were bumped before the write as well, bumping again after the commit or rollback stops
+    # readers that refilled the cache from the old row in between
+    stale_posts = session.info.pop('stale_posts', None)
+    if stale_posts and post_cache_enabled():
+        try:
+            await bump_post_version(*stale_posts)
+        except RedisError:
+            pass
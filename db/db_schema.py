@@ -1,8 +1,9 @@
 import datetime
 from typing import List
 from uuid import uuid4 as uuid
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import String, Boolean, Integer, Text, ForeignKey, DateTime, UniqueConstraint, text, event
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from sqlalchemy import String, Boolean, Integer, BigInteger, Text, ForeignKey, DateTime, UniqueConstraint, Index, \
+    text, event, Computed
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -20,6 +21,7 @@ class User(Base):
     password: Mapped[str] = mapped_column(String, nullable=False)
     email: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False)
+    token_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text('0'))
     post: Mapped[List['Post']] = relationship('Post', back_populates='owner', foreign_keys='Post.owner_id')
     likes_user: Mapped[List['Like']] = relationship('Like', back_populates='reviewer_ref')
     dislikes_user: Mapped[List['Dislike']] = relationship('Dislike', back_populates='reviewer_ref')
@@ -39,8 +41,23 @@ class Post(Base):
     owner_id: Mapped[uuid] = mapped_column(UUID, ForeignKey(User.user_id, ondelete="CASCADE"), nullable=False)
     owner: Mapped['User'] = relationship(back_populates='post', foreign_keys='Post.owner_id')
     modify_id: Mapped[uuid] = mapped_column(UUID, ForeignKey(User.user_id, ondelete="CASCADE"), nullable=False)
+    likes_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text('0'))
+    dislikes_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text('0'))
+    search_vector: Mapped[str] = mapped_column(TSVECTOR, Computed(
+        "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', content), 'B')",
+        persisted=True
+    ), deferred=True)
     likes: Mapped[List['Like']] = relationship('Like', back_populates='post')
     dislikes: Mapped[List['Dislike']] = relationship('Dislike', back_populates='post')
+    __table_args__ = (
+        Index('ix_post_created_at_post_id', 'created_at', 'post_id'),
+        Index('ix_post_update_at_post_id', 'update_at', 'post_id'),
+        Index('ix_post_likes_count_post_id', 'likes_count', 'post_id'),
+        Index('ix_post_owner_id_created_at_post_id', 'owner_id', 'created_at', 'post_id'),
+        Index('ix_post_owner_id_update_at_post_id', 'owner_id', 'update_at', 'post_id'),
+        Index('ix_post_owner_id_likes_count_post_id', 'owner_id', 'likes_count', 'post_id'),
+        Index('ix_post_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     def __repr__(self) -> str:
         return f'{self.title, self.owner}'
@@ -69,3 +86,10 @@ class Dislike(Rate):
 
     post: Mapped['Post'] = relationship('Post', back_populates='dislikes')
     reviewer_ref: Mapped['User'] = relationship('User', back_populates='dislikes_user')
+
+
+class WriterFence(Base):
+    __tablename__ = 'writer_fence'
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    token: Mapped[int] = mapped_column(BigInteger, nullable=False)
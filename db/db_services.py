@@ -1,10 +1,37 @@
 from abc import ABC, abstractmethod
-from typing import Union
-from sqlalchemy import insert, select, delete, update, func
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterator, Optional, Union
+from uuid import UUID
+from sqlalchemy import insert, select, delete, update, func, event, tuple_, literal, values, column, case, Integer, \
+    String, RowMapping, Select, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.db_schema import User, Post, Like, Dislike
+from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
+from cache_redis.cache import post_cache_enabled, get_cached_post, cache_post, bump_post_version
+from db.db_schema import User, Post, Rate, Like, Dislike
 from models import UserModel, UserModelOutput, AuthUser, UserToken, PostModel, UpdatePostModel
-from utils.hasher import hash_pass
+from settings import settings
+from utils.hasher import hash_service
+from utils.paginations import PostFilter
+from utils.ttl_cache import TTLCache
+
+POST_COLUMNS = (
+    Post.post_id, Post.title, Post.content, Post.created_at, Post.update_at, Post.owner_id, Post.modify_id,
+    Post.likes_count, Post.dislikes_count
+)
+
+SORT_COLUMNS = {'created_at': Post.created_at, 'update_at': Post.update_at, 'likes_count': Post.likes_count}
+SEARCH_CONFIG = literal_column("'english'::regconfig")
+
+principal_cache = TTLCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL)
+
+
+@event.listens_for(Session, 'after_commit')
+def drop_stale_principals(session: Session) -> None:
+    for email in session.info.pop('stale_principals', ()):
+        principal_cache.pop(email)
 
 
 class BaseManager(ABC):
@@ -22,11 +49,122 @@ class BaseManager(ABC):
         pass
 
 
-class UserManager(BaseManager):
+class UserRepository(BaseManager):
+
+    @abstractmethod
+    async def create(self, user: UserModel) -> UserModelOutput:
+        pass
+
+    @abstractmethod
+    async def get(self, user: Union[AuthUser, UserToken]) -> dict:
+        pass
+
+    @abstractmethod
+    async def revoke_tokens(self, email: str) -> None:
+        pass
+
+    @abstractmethod
+    async def set_admin(self, email: str, is_admin: bool) -> None:
+        pass
+
+    @abstractmethod
+    async def set_password(self, email: str, password: str) -> None:
+        pass
+
+    async def get_principal(self, email: str) -> dict:
+        principal = principal_cache.get(email)
+        if principal is None:
+            principal = await self.get(UserToken(email=email))
+            if not principal:
+                return {}
+            principal.pop('password')
+            principal_cache.set(email, principal)
+        return dict(principal)
+
+    async def get_token_version(self, email: str) -> Optional[int]:
+        principal = await self.get_principal(email)
+        return principal.get('token_version') if principal else None
+
+    def invalidate(self, email: str) -> None:
+        principal_cache.pop(email)
+        self.db.info.setdefault('stale_principals', set()).add(email)
+
+
+class PostRepository(BaseManager):
+
+    @abstractmethod
+    async def create(self, post: PostModel) -> int:
+        pass
+
+    @abstractmethod
+    async def get(self, post_id: int) -> dict:
+        pass
+
+    @abstractmethod
+    async def get_stamp(self, post_id: int) -> dict:
+        pass
+
+    @abstractmethod
+    async def get_row(self, post_id: int) -> dict:
+        pass
+
+    @abstractmethod
+    async def get_many(self) -> list[dict]:
+        pass
+
+    @abstractmethod
+    def stream_many(self, chunk_size: int) -> AsyncIterator[dict]:
+        pass
+
+    @abstractmethod
+    async def get_many_filter(self, page: int, limit: int, cursor: Optional[tuple[Union[datetime, int], int]] = None,
+                              filters: Optional[PostFilter] = None, sort: str = 'created_at',
+                              descending: bool = False) -> list[dict]:
+        pass
+
+    @abstractmethod
+    async def search(self, text: str, limit: int, cursor: Optional[tuple[float, int]] = None) -> list[dict]:
+        pass
+
+    @abstractmethod
+    async def update(self, post_id: int, data: PostModel) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, post_id: int) -> None:
+        pass
+
+    @abstractmethod
+    async def rate(self, rate: type[Rate], email: str, post_id: int, add: bool,
+                   user_id: Optional[UUID] = None) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    async def apply_rates(self, rate: type[Rate], changes: dict[tuple[int, str], bool]) -> None:
+        pass
+
+    async def add_like(self, email: str, post_id: int) -> int:
+        result = await self.rate(Like, email, post_id, add=True)
+        return result.get('total') if result else 0
+
+    async def remove_like(self, email: str, post_id: int) -> int:
+        result = await self.rate(Like, email, post_id, add=False)
+        return result.get('total') if result else 0
+
+    async def add_dis(self, email: str, post_id: int) -> int:
+        result = await self.rate(Dislike, email, post_id, add=True)
+        return result.get('total') if result else 0
+
+    async def remove_dis(self, email: str, post_id: int) -> int:
+        result = await self.rate(Dislike, email, post_id, add=False)
+        return result.get('total') if result else 0
+
+
+class UserManager(UserRepository):
 
     async def create(self, user: UserModel) -> UserModelOutput:
         user_to_inset = user.copy()
-        user_to_inset.password = hash_pass(user.password)
+        user_to_inset.password = await hash_service.hash_pass(user.password)
         query = insert(User).values(user_to_inset.dict()).returning(
             User.user_id, User.first_name, User.last_name, User.email)
         returning_result = await self.db.execute(query)
@@ -43,91 +181,200 @@ class UserManager(BaseManager):
             user_dict.pop('_sa_instance_state', None)
         return user_dict
 
+    async def revoke_tokens(self, email: str) -> None:
+        query = update(User).where(User.email == email).values(token_version=User.token_version + 1)
+        await self.db.execute(query)
+        self.invalidate(email)
+
+    async def set_admin(self, email: str, is_admin: bool) -> None:
+        query = update(User).where(User.email == email).values(
+            is_admin=is_admin, token_version=User.token_version + 1)
+        await self.db.execute(query)
+        self.invalidate(email)
 
-class PostManager(BaseManager):
+    async def set_password(self, email: str, password: str) -> None:
+        hashed = await hash_service.hash_pass(password)
+        query = update(User).where(User.email == email).values(
+            password=hashed, token_version=User.token_version + 1)
+        await self.db.execute(query)
+        self.invalidate(email)
+
+
+class PostManager(PostRepository):
 
     async def create(self, post: PostModel) -> int:
         query = insert(Post).values(**post.dict()).returning(Post.post_id)
-        post_id = await self.db.execute(query)
-        return post_id.fetchone()[0]
+        post_id = (await self.db.execute(query)).fetchone()[0]
+        self.db.info.setdefault('written_posts', set()).add(post_id)
+        return post_id
 
     async def get(self, post_id: int) -> dict:
-        query = select(Post).where(Post.post_id == post_id)
+        if not post_cache_enabled():
+            return await self.get_row(post_id)
+        try:
+            version, post, likes, dislikes = await get_cached_post(post_id)
+        except RedisError:
+            return await self.get_row(post_id)
+        if post is None:
+            post = await self.get_row(post_id)
+            if not post:
+                return {}
+            if not self.has_written(post_id):  # only committed rows are cached, a rollback can't leave them behind
+                try:
+                    await cache_post(post_id, version, post)
+                except RedisError:
+                    pass
+        post.update(likes_count=likes, dislikes_count=dislikes)
+        return post
+
+    async def get_stamp(self, post_id: int) -> dict:
+        counts = None
+        if post_cache_enabled():
+            try:
+                _, post, likes, dislikes = await get_cached_post(post_id)
+                counts = {'likes_count': likes, 'dislikes_count': dislikes}
+                if post:
+                    return {'post_id': post_id, 'update_at': post.get('update_at'), **counts}
+            except RedisError:
+                pass
+        query = select(Post.post_id, Post.update_at, Post.likes_count, Post.dislikes_count).where(
+            Post.post_id == post_id)
         returning_result = await self.db.execute(query)
-        if not returning_result:
+        stamp = returning_result.mappings().fetchone()
+        if not stamp:
             return {}
-        post = returning_result.scalar()
-        post_dict = {}
-        if post:
-            post_dict.update(post.__dict__)
-            post_dict.pop('_sa_instance_state')
-        return post_dict
+        return {**stamp, **counts} if counts else dict(stamp)
+
+    async def get_row(self, post_id: int) -> dict:
+        query = select(*POST_COLUMNS).where(Post.post_id == post_id)
+        returning_result = await self.db.execute(query)
+        post = returning_result.mappings().fetchone()
+        return dict(post) if post else {}
 
     async def get_many(self) -> list[dict]:
-        query = select(Post)
+        query = select(*POST_COLUMNS)
         returning_result = await self.db.execute(query)
-        posts = returning_result.scalars()
-        if posts:
-            posts_list = [post.__dict__ for post in posts]
-            for x in posts_list:
-                x.pop('_sa_instance_state', None)
-        else:
-            posts_list = []
-        return posts_list
+        return [dict(post) for post in returning_result.mappings()]
 
-    async def get_many_filter(self, page: int, limit: int) -> list[dict]:
-        if page:
-            offset = page * limit + 1
+    async def stream_many(self, chunk_size: int) -> AsyncIterator[dict]:
+        query = select(*POST_COLUMNS).order_by(Post.post_id).execution_options(yield_per=chunk_size)
+        returning_result = await self.db.stream(query)
+        async for rows in returning_result.mappings().partitions():
+            for row in rows:
+                yield dict(row)
+
+    @staticmethod
+    def filter_query(page: int, limit: int, cursor: Optional[tuple[Union[datetime, int], int]] = None,
+                     filters: Optional[PostFilter] = None, sort: str = 'created_at',
+                     descending: bool = False) -> Select:
+        # served by the [owner_id,] <sort>, post_id indexes, a range on the other timestamp is only a filter:
+        # an index can't seek a range on a column that follows the ordered one, so no extra indexes would help,
+        # and a narrow range is left to the planner as a scan of the other timestamp's index plus a top-N sort
+        sort_column = SORT_COLUMNS[sort]
+        query = select(*POST_COLUMNS).limit(limit)
+        if filters and filters.owner_id:
+            query = query.where(Post.owner_id == filters.owner_id)
+        if filters and filters.created_since:
+            query = query.where(Post.created_at >= filters.created_since)
+        if filters and filters.created_before:
+            query = query.where(Post.created_at < filters.created_before)
+        if filters and filters.updated_since:
+            query = query.where(Post.update_at >= filters.updated_since)
+        if filters and filters.updated_before:
+            query = query.where(Post.update_at < filters.updated_before)
+        if descending:
+            query = query.order_by(sort_column.desc(), Post.post_id.desc())
         else:
-            offset = 0
-        query = select(Post).limit(limit).offset(offset)
-        returning_result = await self.db.execute(query)
-        posts = returning_result.scalars()
-        if posts:
-            posts_list = [post.__dict__ for post in posts]
-            for x in posts_list:
-                x.pop('_sa_instance_state', None)
+            query = query.order_by(sort_column, Post.post_id)
+        if cursor:
+            keyset = tuple_(sort_column, Post.post_id)
+            query = query.where(keyset < cursor if descending else keyset > cursor)
         else:
-            posts_list = []
-        return posts_list
+            query = query.offset(page * limit)
+        return query
+
+    async def get_many_filter(self, page: int, limit: int, cursor: Optional[tuple[Union[datetime, int], int]] = None,
+                              filters: Optional[PostFilter] = None, sort: str = 'created_at',
+                              descending: bool = False) -> list[dict]:
+        returning_result = await self.db.execute(self.filter_query(page, limit, cursor, filters, sort, descending))
+        return [dict(post) for post in returning_result.mappings()]
+
+    async def search(self, text: str, limit: int, cursor: Optional[tuple[float, int]] = None) -> list[dict]:
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+        rank = func.ts_rank(Post.search_vector, tsquery)
+        query = select(*POST_COLUMNS, rank.label('rank')).where(Post.search_vector.bool_op('@@')(tsquery)).order_by(
+            rank.desc(), Post.post_id.desc()).limit(limit)
+        if cursor:
+            query = query.where(tuple_(rank, Post.post_id) < cursor)
+        returning_result = await self.db.execute(query)
+        return [dict(post) for post in returning_result.mappings()]
 
     async def update(self, post_id: id, data: PostModel) -> None:
         data_dict = {key: value for key, value in data.dict().items() if value}
         query = update(Post).where(Post.post_id == post_id).values(**data_dict)
         await self.db.execute(query)
+        await self.invalidate(post_id)
 
     async def delete(self, post_id: int) -> None:
         query = delete(Post).where(Post.post_id == post_id)
         await self.db.execute(query)
+        await self.invalidate(post_id)
 
-    async def add_like(self, email: str, post_id: int) -> int:
-        query = insert(Like).values(post_id=post_id, reviewer=email)
-        await self.db.execute(query)
-        query = select(func.count(Like.rate_id)).join(Post).where(Post.post_id == post_id)
-        row_likes_for_post = await self.db.execute(query)
-        likes_for_post = row_likes_for_post.scalar()
-        return likes_for_post
+    def has_written(self, post_id: int) -> bool:
+        return post_id in self.db.info.get('stale_posts', ()) or post_id in self.db.info.get('written_posts', ())
 
-    async def remove_like(self, email: str, post_id: int) -> int:
-        query = delete(Like).where(Like.post_id == post_id, Like.reviewer == email)
-        await self.db.execute(query)
-        query = select(func.count(Like.rate_id)).join(Post).where(Post.post_id == post_id)
-        row_likes_for_post = await self.db.execute(query)
-        likes_for_post = row_likes_for_post.scalar()
-        return likes_for_post
+    async def invalidate(self, post_id: int) -> None:
+        self.db.info.setdefault('stale_posts', set()).add(post_id)
+        if post_cache_enabled():
+            await bump_post_version(post_id)
 
-    async def add_dis(self, email: str, post_id: int) -> int:
-        query = insert(Dislike).values(post_id=post_id, reviewer=email)
-        await self.db.execute(query)
-        query = select(func.count(Dislike.rate_id)).join(Post).where(Post.post_id == post_id)
-        row_dis_for_post = await self.db.execute(query)
-        dis_for_post = row_dis_for_post.scalar()
-        return dis_for_post
+    async def rate(self, rate: type[Rate], email: str, post_id: int, add: bool,
+                   user_id: Optional[UUID] = None) -> Optional[RowMapping]:
+        counter = Post.likes_count if rate is Like else Post.dislikes_count
+        target = select(Post.post_id, Post.owner_id, counter.label('total')).where(
+            Post.post_id == post_id).cte('target')
+        allowed = select(target.c.post_id)
+        if user_id:
+            allowed = allowed.where(target.c.owner_id != user_id)
+        if add:
+            changed = pg_insert(rate).from_select(
+                ['post_id', 'reviewer'], allowed.add_columns(literal(email))
+            ).on_conflict_do_nothing().returning(rate.post_id).cte('changed')
+        else:
+            changed = delete(rate).where(rate.reviewer == email, rate.post_id.in_(allowed)).returning(
+                rate.post_id).cte('changed')
+        delta = select(func.count()).select_from(changed).scalar_subquery()
+        counted = update(Post).where(Post.post_id == post_id, delta > 0).values(
+            {counter: counter + delta if add else counter - delta, Post.update_at: Post.update_at}
+        ).returning(counter.label('total')).cte('counted')
+        query = select(
+            target.c.owner_id,
+            delta.label('changed'),
+            func.coalesce(select(counted.c.total).scalar_subquery(), target.c.total).label('total')
+        )
+        returning_result = await self.db.execute(query)
+        return returning_result.mappings().fetchone()
 
-    async def remove_dis(self, email: str, post_id: int) -> int:
-        query = delete(Dislike).where(Dislike.post_id == post_id, Dislike.reviewer == email)
-        await self.db.execute(query)
-        query = select(func.count(Dislike.rate_id)).join(Post).where(Post.post_id == post_id)
-        row_dis_for_post = await self.db.execute(query)
-        dis_for_post = row_dis_for_post.scalar()
-        return dis_for_post
+    async def apply_rates(self, rate: type[Rate], changes: dict[tuple[int, str], bool]) -> None:
+        counter = Post.likes_count if rate is Like else Post.dislikes_count
+        deltas = Counter()
+        added = [(post_id, email) for (post_id, email), add in changes.items() if add]
+        if added:
+            rows = values(column('post_id', Integer), column('reviewer', String), name='rows').data(added)
+            existing = select(rows.c.post_id, rows.c.reviewer).where(
+                rows.c.post_id.in_(select(Post.post_id)), rows.c.reviewer.in_(select(User.email)))
+            query = pg_insert(rate).from_select(['post_id', 'reviewer'], existing).on_conflict_do_nothing().returning(
+                rate.post_id)
+            returning_result = await self.db.execute(query)
+            deltas.update(returning_result.scalars())
+        removed = [(post_id, email) for (post_id, email), add in changes.items() if not add]
+        if removed:
+            query = delete(rate).where(tuple_(rate.post_id, rate.reviewer).in_(removed)).returning(rate.post_id)
+            returning_result = await self.db.execute(query)
+            deltas.subtract(returning_result.scalars())
+        deltas = {post_id: delta for post_id, delta in deltas.items() if delta}
+        if deltas:
+            query = update(Post).where(Post.post_id.in_(deltas)).values(
+                {counter: counter + case(deltas, value=Post.post_id, else_=0), Post.update_at: Post.update_at}
+            )
+            await self.db.execute(query)
@@ -0,0 +1,242 @@
+import re
+from bisect import bisect_right, insort
+from datetime import datetime
+from typing import AsyncIterator, Callable, Optional, Union
+from uuid import UUID, uuid4
+from sqlalchemy.exc import IntegrityError
+from db.db_schema import Rate, Like
+from db.db_services import UserRepository, PostRepository, principal_cache
+from models import UserModel, UserModelOutput, AuthUser, UserToken, PostModel
+from utils.hasher import hash_service
+from utils.paginations import PostFilter
+
+
+class MemoryStore:
+    def __init__(self):
+        self.users: dict[str, dict] = {}
+        self.posts: dict[int, dict] = {}
+        self.created_index: list[tuple[datetime, int]] = []
+        self.rates: dict[str, dict[int, set[str]]] = {'like': {}, 'dislike': {}}
+        self.last_post_id = 0
+
+    def clear(self) -> None:
+        self.__init__()
+
+
+store = MemoryStore()
+
+
+class MemorySession:
+    # the subset of AsyncSession used by get_db; changes are undone unless committed, like a transaction
+    def __init__(self, memory_store: MemoryStore = store):
+        self.store = memory_store
+        self.info: dict = {}
+        self.undo_log: list[Callable[[], None]] = []
+
+    def on_rollback(self, undo: Callable[[], None]) -> None:
+        self.undo_log.append(undo)
+
+    # rows are changed in place and each change logs its own inverse, so a rollback keeps other sessions' changes
+    def insert(self, mapping: dict, key, value) -> None:
+        mapping[key] = value
+        self.on_rollback(lambda: mapping.pop(key, None))
+
+    def remove(self, mapping: dict, key) -> dict:
+        value = mapping.pop(key)
+        self.on_rollback(lambda: mapping.setdefault(key, value))
+        return value
+
+    def assign(self, row: dict, **values) -> None:
+        previous = {key: row[key] for key in values}
+        row.update(values)
+        self.on_rollback(lambda: row.update(previous))
+
+    def increment(self, row: dict, key: str, delta: int) -> None:
+        row[key] += delta
+
+        def undo() -> None:
+            row[key] -= delta
+        self.on_rollback(undo)
+
+    async def commit(self) -> None:
+        self.undo_log.clear()
+        for email in self.info.pop('stale_principals', ()):
+            principal_cache.pop(email)
+
+    async def rollback(self) -> None:
+        while self.undo_log:
+            self.undo_log.pop()()
+
+    async def close(self) -> None:
+        await self.rollback()
+
+    async def __aenter__(self) -> 'MemorySession':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+def matches(post: dict, filters: Optional[PostFilter]) -> bool:
+    if filters is None:
+        return True
+    return all((
+        not filters.owner_id or post['owner_id'] == filters.owner_id,
+        not filters.created_since or post['created_at'] >= filters.created_since,
+        not filters.created_before or post['created_at'] < filters.created_before,
+        not filters.updated_since or post['update_at'] >= filters.updated_since,
+        not filters.updated_before or post['update_at'] < filters.updated_before,
+    ))
+
+
+class MemoryUserManager(UserRepository):
+
+    async def create(self, user: UserModel) -> UserModelOutput:
+        password = await hash_service.hash_pass(user.password)
+        # no await between the check and the insert, another request can't register the email in between
+        users = self.db.store.users
+        if user.email in users:
+            raise IntegrityError('INSERT INTO "user"', {'email': user.email}, ValueError('duplicate email'))
+        row = {**user.dict(), 'password': password, 'user_id': uuid4(), 'is_admin': False, 'token_version': 0}
+        self.db.insert(users, user.email, row)
+        return UserModelOutput(**row)
+
+    async def get(self, user: Union[AuthUser, UserToken]) -> dict:
+        return dict(self.db.store.users.get(user.email, {}))
+
+    async def change(self, email: str, **values) -> None:
+        row = self.db.store.users.get(email)
+        if row is None:
+            return
+        self.db.assign(row, **values)
+        self.db.increment(row, 'token_version', 1)
+        self.invalidate(email)
+
+    async def revoke_tokens(self, email: str) -> None:
+        await self.change(email)
+
+    async def set_admin(self, email: str, is_admin: bool) -> None:
+        await self.change(email, is_admin=is_admin)
+
+    async def set_password(self, email: str, password: str) -> None:
+        await self.change(email, password=await hash_service.hash_pass(password))
+
+
+class MemoryPostManager(PostRepository):
+
+    def insert(self, post: dict) -> None:
+        index, key = self.db.store.created_index, (post['created_at'], post['post_id'])
+        self.db.insert(self.db.store.posts, post['post_id'], post)
+        insort(index, key)
+        self.db.on_rollback(lambda: index.remove(key))
+
+    def remove(self, post_id: int) -> None:
+        index = self.db.store.created_index
+        post = self.db.remove(self.db.store.posts, post_id)
+        index.remove((post['created_at'], post_id))
+        self.db.on_rollback(lambda: insort(index, (post['created_at'], post_id)))
+
+    async def create(self, post: PostModel) -> int:
+        memory_store = self.db.store
+        memory_store.last_post_id += 1
+        post_id = memory_store.last_post_id
+        now = datetime.now()
+        self.insert({'post_id': post_id, **post.dict(), 'created_at': now, 'update_at': now,
+                     'likes_count': 0, 'dislikes_count': 0})
+        return post_id
+
+    async def get(self, post_id: int) -> dict:
+        return await self.get_row(post_id)
+
+    async def get_stamp(self, post_id: int) -> dict:
+        post = self.db.store.posts.get(post_id)
+        if not post:
+            return {}
+        return {key: post[key] for key in ('post_id', 'update_at', 'likes_count', 'dislikes_count')}
+
+    async def get_row(self, post_id: int) -> dict:
+        return dict(self.db.store.posts.get(post_id, {}))
+
+    async def get_many(self) -> list[dict]:
+        return [dict(post) for post in self.db.store.posts.values()]
+
+    async def stream_many(self, chunk_size: int) -> AsyncIterator[dict]:
+        posts = self.db.store.posts
+        for post_id in sorted(posts):
+            yield dict(posts[post_id])
+
+    async def get_many_filter(self, page: int, limit: int, cursor: Optional[tuple[Union[datetime, int], int]] = None,
+                              filters: Optional[PostFilter] = None, sort: str = 'created_at',
+                              descending: bool = False) -> list[dict]:
+        if sort == 'created_at' and not descending and (filters is None or not any(vars(filters).values())):
+            index = self.db.store.created_index
+            start = bisect_right(index, cursor) if cursor else page * limit
+            return [dict(self.db.store.posts[post_id]) for _, post_id in index[start:start + limit]]
+        posts = sorted(((post[sort], post_id), post) for post_id, post in self.db.store.posts.items()
+                       if matches(post, filters))
+        if descending:
+            posts.reverse()
+        if cursor:
+            posts = [(key, post) for key, post in posts if (key < cursor if descending else key > cursor)]
+        else:
+            posts = posts[page * limit:]
+        return [dict(post) for _, post in posts[:limit]]
+
+    async def search(self, text: str, limit: int, cursor: Optional[tuple[float, int]] = None) -> list[dict]:
+        # a word match ranked like the setweight A/B tsvector, not a port of the PostgreSQL text search
+        words = set(re.findall(r'\w+', text.lower()))
+        found = []
+        for post in self.db.store.posts.values():
+            title, content = re.findall(r'\w+', post['title'].lower()), re.findall(r'\w+', post['content'].lower())
+            if words and words <= set(title) | set(content):
+                rank = sum(title.count(word) + .4 * content.count(word) for word in words) / 10
+                if not cursor or (rank, post['post_id']) < cursor:
+                    found.append({**post, 'rank': rank})
+        found.sort(key=lambda post: (post['rank'], post['post_id']), reverse=True)
+        return found[:limit]
+
+    async def update(self, post_id: int, data: PostModel) -> None:
+        post = self.db.store.posts.get(post_id)
+        if post is None:
+            return
+        values = {key: value for key, value in data.dict().items() if value}
+        self.db.assign(post, **values, update_at=datetime.now())
+
+    async def delete(self, post_id: int) -> None:
+        if post_id not in self.db.store.posts:
+            return
+        if any(self.db.store.rates[table].get(post_id) for table in self.db.store.rates):
+            # "like" and "dislike" reference the post without ON DELETE CASCADE
+            raise IntegrityError('DELETE FROM post', {'post_id': post_id}, ValueError('post is rated'))
+        self.remove(post_id)
+
+    def change_rate(self, rate: type[Rate], post_id: int, email: str, add: bool) -> int:
+        reviewers = self.db.store.rates[rate.__tablename__].setdefault(post_id, set())
+        if (email in reviewers) == add:
+            return 0
+        if add:
+            reviewers.add(email)
+            self.db.on_rollback(lambda: reviewers.discard(email))
+        else:
+            reviewers.discard(email)
+            self.db.on_rollback(lambda: reviewers.add(email))
+        counter = 'likes_count' if rate is Like else 'dislikes_count'
+        self.db.increment(self.db.store.posts[post_id], counter, 1 if add else -1)
+        return 1
+
+    async def rate(self, rate: type[Rate], email: str, post_id: int, add: bool,
+                   user_id: Optional[UUID] = None) -> Optional[dict]:
+        post = self.db.store.posts.get(post_id)
+        if post is None:
+            return None
+        changed = 0
+        if not user_id or post['owner_id'] != user_id:
+            changed = self.change_rate(rate, post_id, email, add)
+        counter = 'likes_count' if rate is Like else 'dislikes_count'
+        return {'owner_id': post['owner_id'], 'changed': changed, 'total': self.db.store.posts[post_id][counter]}
+
+    async def apply_rates(self, rate: type[Rate], changes: dict[tuple[int, str], bool]) -> None:
+        memory_store = self.db.store
+        for (post_id, email), add in changes.items():
+            if post_id in memory_store.posts and (not add or email in memory_store.users):
+                self.change_rate(rate, post_id, email, add)
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import socket
+from contextlib import suppress
+from typing import Optional
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from redis.commands.core import AsyncScript
+from redis.exceptions import ResponseError
+from cache_redis import cache
+from db.db_config import async_session
+from db.db_schema import Like, Dislike, WriterFence
+from db.db_services import PostManager
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+RATE_MODELS = {'likes': Like, 'dis': Dislike}
+
+# Only the lock holder consumes the stream, so changes of one rate are applied in the order they were made.
+# The consumer name is shared: a new holder replays entries the previous one read but never acknowledged.
+CONSUMER = 'rate-writer'
+
+# Upper bound in seconds of the doubling delay between failed flushes.
+MAX_BACKOFF = 30
+
+# KEYS: lock, fence; ARGV: owner, ttl in ms.
+# Returns the fencing token of the current hold, each new hold gets a larger one; 0 when another owner holds the lock.
+LOCK_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return redis.call('INCR', KEYS[2])
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return tonumber(redis.call('GET', KEYS[2]))
+end
+return 0
+"""
+lock_script = AsyncScript(None, LOCK_SCRIPT.encode())
+
+# KEYS: lock, stream; ARGV: owner, group, entry ids.
+ACK_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('XACK', KEYS[2], ARGV[2], unpack(ARGV, 3))
+redis.call('XDEL', KEYS[2], unpack(ARGV, 3))
+return 1
+"""
+ack_script = AsyncScript(None, ACK_SCRIPT.encode())
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class RateWriter:
+    def __init__(self, stream: str, group: str, batch_size: int, flush_interval: int, owner: str):
+        self.stream = stream
+        self.group = group
+        self.lock = f'{stream}:lock'
+        self.fence_key = f'{stream}:fence'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval / 1000
+        self.owner = owner
+        self.applied = 0
+        self.fence = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    async def create_group(self) -> None:
+        try:
+            await cache.r.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def start(self) -> None:
+        await self.create_group()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _hold_lock(self) -> int:
+        ttl = int(self.flush_interval * 3000) + 1000
+        return await lock_script(keys=[self.lock, self.fence_key], args=[self.owner, ttl], client=cache.r)
+
+    async def _heartbeat(self) -> None:
+        # a slow commit must not let the lease lapse; once it changes hands the fence check rejects the batch
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if await self._hold_lock() != self.fence:
+                return
+
+    async def _check_fence(self, session: AsyncSession) -> None:
+        # runs first in the flush transaction, the row lock orders it against a newer holder's flush
+        query = pg_insert(WriterFence).values(name=self.stream, token=self.fence).on_conflict_do_update(
+            index_elements=[WriterFence.name], set_={'token': self.fence}, where=WriterFence.token <= self.fence
+        ).returning(WriterFence.token)
+        if (await session.execute(query)).first() is None:
+            raise LeaseLost(f'Fencing token {self.fence} of {self.stream} is stale')
+
+    async def run(self) -> None:
+        replay = True
+        failures = 0
+        while not self._stopping.is_set():
+            try:
+                self.fence = await self._hold_lock()
+                if not self.fence:
+                    await self._sleep(self.flush_interval)
+                    replay = True
+                    continue
+                if replay:
+                    replay = await self.flush('0')
+                else:
+                    await self.flush('>')
+                failures = 0
+            except LeaseLost:
+                logger.warning('Rate write-behind lease lost, the new holder replays the pending entries')
+                replay = True
+            except Exception:
+                # anything escaping here would end the task while the endpoints keep appending to the stream
+                failures += 1
+                delay = min(self.flush_interval * 2 ** failures, MAX_BACKOFF)
+                logger.exception('Rate write-behind flush failed, retrying pending entries in %.1fs', delay)
+                replay = True
+                await self._sleep(delay)
+        try:
+            self.fence = await self._hold_lock()
+            if self.fence:
+                await self.flush('>')
+        except Exception:
+            logger.exception('Rate write-behind final flush failed')
+
+    async def _sleep(self, delay: float) -> None:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def read(self, last_id: str) -> list[tuple[str, dict]]:
+        if last_id == '0':
+            response = await cache.r.xreadgroup(self.group, CONSUMER, {self.stream: '0'}, count=self.batch_size)
+            return response[0][1] if response else []
+        entries = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(entries) < self.batch_size and not self._stopping.is_set():
+            remaining = int((deadline - loop.time()) * 1000)
+            if remaining <= 0:
+                break
+            response = await cache.r.xreadgroup(self.group, CONSUMER, {self.stream: '>'},
+                                                count=self.batch_size - len(entries), block=remaining)
+            if response:
+                entries.extend(response[0][1])
+        return entries
+
+    async def flush(self, last_id: str) -> bool:
+        entries = await self.read(last_id)
+        if not entries:
+            return False
+        changes = {rate_type: {} for rate_type in RATE_MODELS}
+        for entry_id, fields in entries:  # later entries win, a like then an unlike collapses into the unlike
+            try:
+                key = (int(fields['post_id']), fields['email'])
+                changes[fields['rate']][key] = fields['add'] == '1'
+            except (TypeError, KeyError, ValueError):
+                # a deleted pending entry comes back without fields, it is acknowledged with the batch
+                logger.warning('Skipping malformed rate stream entry %s: %r', entry_id, fields)
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            async with async_session() as session:
+                await self._check_fence(session)
+                manager = PostManager(session)
+                for rate_type, rate_changes in changes.items():
+                    if rate_changes:
+                        await manager.apply_rates(RATE_MODELS[rate_type], rate_changes)
+                await session.commit()
+            ids = [entry_id for entry_id, _ in entries]
+            # replaying a committed batch is harmless, so a batch is only acknowledged while the lease is still ours
+            if not await ack_script(keys=[self.lock, self.stream], args=[self.owner, self.group, *ids],
+                                    client=cache.r):
+                raise LeaseLost(f'Lease on {self.stream} lost before acknowledging the batch')
+        finally:
+            heartbeat.cancel()
+            with suppress(asyncio.CancelledError):
+                await heartbeat
+        self.applied += len(entries)
+        return True
+
+
+rate_writer = RateWriter(
+    settings.RATE_STREAM,
+    settings.RATE_STREAM_GROUP,
+    settings.RATE_WRITER_BATCH_SIZE,
+    settings.RATE_WRITER_FLUSH_INTERVAL,
+    f'{socket.gethostname()}:{os.getpid()}'
+)
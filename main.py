@@ -1,23 +1,74 @@
+from contextlib import asynccontextmanager
 from typing import Optional
 import uvicorn
-from fastapi import FastAPI, Depends, HTTPException, Response, Cookie, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, Cookie, APIRouter, Body, Query
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import JWTError
+from pydantic import conlist
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
-from auth_backend.authenticate import create_token, get_user_from_token, create_refresh_token, decode_token
-from cache_redis.cache import show_reviewers, get_rate
-from db.db_config import get_db
-from db.db_services import UserManager, PostManager
+from auth_backend.authenticate import create_token, get_user_from_token, create_refresh_token, decode_token, \
+    user_claims, CLAIMS_VERSION, token_cache
+from cache_redis.cache import open_pool, close_pool
+from db.db_config import get_db, engine, pool_stats
+from db.db_services import principal_cache
+from db.rate_writer import rate_writer
 from models import UserModel, AuthUser, UserModelOutput, PostModel, UpdatePostModel
 from auth_backend.authenticate import authenticate
-from utils.dependencies import is_owner, get_user_by_token, check_like, check_dislike, check_like_for_del, \
-    check_dis_for_del
-from utils.paginations import Paginator
-
-app = FastAPI(title='service')
+from utils.dependencies import is_owner, get_user_by_token, rate_post
+from utils.etag import post_etag, list_etag, is_conditional, not_modified
+from utils.hasher import hash_service, HashPoolSaturated
+from utils.metrics import MetricsMiddleware, stats_gauge, render
+from utils.profiler import ProfilerMiddleware
+from utils.request_stats import RequestStatsMiddleware
+from utils.paginations import Paginator, SearchPaginator, PostFilter
+from utils.streaming import ndjson
+from utils.watchdog import loop_watchdog
+from settings import settings
+from storage import UserManager, PostManager, get_rates, scan_reviewers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await loop_watchdog.start()
+    if settings.STORAGE_BACKEND == 'sql':
+        open_pool()
+    if settings.RATE_WRITE_BEHIND:
+        await rate_writer.start()
+    yield
+    await rate_writer.stop()
+    await close_pool()
+    hash_service.shutdown()
+    await loop_watchdog.stop()
+
+
+app = FastAPI(title='service', lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestStatsMiddleware)
+app.add_middleware(ProfilerMiddleware)
 post_rout = APIRouter(prefix='/post')
 
+stats_gauge('hash_pool', 'Password hashing pool stats', hash_service.stats)
+stats_gauge('db_pool', 'Database connection pool stats', lambda: pool_stats(engine))
+stats_gauge('principal_cache', 'Principal cache stats', principal_cache.stats)
+stats_gauge('token_cache', 'Verified token cache stats', token_cache.stats)
+stats_gauge('loop_watchdog', 'Event loop watchdog stats', loop_watchdog.stats)
+
+
+@app.exception_handler(HashPoolSaturated)
+async def hash_pool_saturated(request: Request, exc: HashPoolSaturated) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': str(exc)},
+        headers={'Retry-After': '1'}
+    )
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render(), media_type='text/plain; version=0.0.4')
+
 
 @app.post('/login/token')
 async def authentication(response: Response, form_data: OAuth2PasswordRequestForm = Depends(),
@@ -26,8 +77,9 @@ async def authentication(response: Response, form_data: OAuth2PasswordRequestFor
     user = AuthUser(**data)
     check = await authenticate(user, db)
     if check[0]:
-        access_token = create_token({"sub": form_data.username})
-        refresh_token, expire = create_refresh_token({"sub": form_data.username})
+        claims = user_claims(check[0])
+        access_token = create_token(claims)
+        refresh_token, expire = create_refresh_token(claims)
     else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -52,51 +104,93 @@ async def register(data: UserModel, db: AsyncSession = Depends(get_db)) -> UserM
 
 
 @app.post('/refresh')
-async def refresh_token(refresh_token: str = Cookie(None)) -> dict:
+async def refresh_token(refresh_token: str = Cookie(None), db: AsyncSession = Depends(get_db)) -> dict:
+    invalid_refresh_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate refresh token"
+    )
     try:
         payload = decode_token(refresh_token)
     except (JWTError, AttributeError):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate refresh token"
-        )
-    access_token = create_token(payload)
+        raise invalid_refresh_token
+    if not payload.get('sub'):
+        raise invalid_refresh_token
+    manager = UserManager(db)
+    manager.invalidate(payload.get('sub'))  # the token version must be current, not up to PRINCIPAL_CACHE_TTL old
+    principal = await manager.get_principal(payload.get('sub'))
+    if not principal:
+        raise invalid_refresh_token
+    if payload.get('ver') == CLAIMS_VERSION and payload.get('tv') != principal.get('token_version'):  # revoked
+        raise invalid_refresh_token
+    access_token = create_token(user_claims(principal))
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @post_rout.get('/filter')
-async def read_posts_filter(token: dict = Depends(get_user_from_token), db: AsyncSession = Depends(get_db),
-                     pagination: Paginator = Depends(Paginator)) -> list[dict]:
-    posts_list = await PostManager(db).get_many_filter(**pagination.__dict__)
+async def read_posts_filter(request: Request, token: dict = Depends(get_user_from_token),
+                            db: AsyncSession = Depends(get_db),
+                            pagination: Paginator = Depends(Paginator),
+                            filters: PostFilter = Depends(PostFilter)) -> list[dict]:
+    posts_list = await PostManager(db).get_many_filter(pagination.page, pagination.limit, pagination.cursor, filters,
+                                                       pagination.sort, pagination.descending)
     if not posts_list:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Posts does'\t exists"
         )
-    return posts_list
+    headers = {'ETag': list_etag(posts_list)}
+    next_cursor = pagination.next_cursor(posts_list)
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    if not_modified(request, headers.get('ETag')):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return ORJSONResponse(posts_list, headers=headers)
+
+
+@post_rout.get('/search')
+async def search_posts(q: str = Query(min_length=1, max_length=200), token: dict = Depends(get_user_from_token),
+                       db: AsyncSession = Depends(get_db),
+                       pagination: SearchPaginator = Depends(SearchPaginator)) -> list[dict]:
+    posts_list = await PostManager(db).search(q, pagination.limit, pagination.cursor)
+    headers = {}
+    next_cursor = pagination.next_cursor(posts_list)
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    return ORJSONResponse(posts_list, headers=headers)
 
 
 @post_rout.get('')
-async def read_posts(token: dict = Depends(get_user_from_token), db: AsyncSession = Depends(get_db)) -> list[dict]:
+async def read_posts(request: Request, token: dict = Depends(get_user_from_token),
+                     db: AsyncSession = Depends(get_db)) -> list[dict]:
+    if 'application/x-ndjson' in request.headers.get('accept', ''):
+        rows = PostManager(db).stream_many(settings.POST_STREAM_CHUNK_SIZE)
+        return StreamingResponse(ndjson(rows), media_type='application/x-ndjson')
     posts_list = await PostManager(db).get_many()
     if not posts_list:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Posts does'\t exists"
         )
-    return posts_list
+    return ORJSONResponse(posts_list)
 
 
 @post_rout.get('/{post_id}')
-async def read_post(post_id: int, token: dict = Depends(get_user_from_token),
+async def read_post(post_id: int, request: Request, token: dict = Depends(get_user_from_token),
                     db: AsyncSession = Depends(get_db)) -> dict:
-    post = await PostManager(db).get(post_id)
+    manager = PostManager(db)
+    if is_conditional(request):
+        stamp = await manager.get_stamp(post_id)
+        if stamp:
+            etag = post_etag(stamp)
+            if not_modified(request, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    post = await manager.get(post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post {post_id} does'\t exists"
         )
-    return post
+    return ORJSONResponse(post, headers={'ETag': post_etag(post)})
 
 
 @post_rout.post('')
@@ -132,47 +226,52 @@ async def remove_post(post_id: int, token: dict = Depends(get_user_from_token),
 @post_rout.post('/{post_id}/like')
 async def add_like(post_id: int, token: dict = Depends(get_user_from_token),
                    db: AsyncSession = Depends(get_db)) -> dict:
-    email = await check_like(token, post_id, db)
-    if email:
-        total_likes = await PostManager(db).add_like(email, post_id)
-        return {post_id: total_likes}
+    total_likes = await rate_post(token, post_id, 'likes', True, db)
+    return {post_id: total_likes}
 
 
 @post_rout.delete('/{post_id}/like')
 async def remove_like(post_id: int, token: dict = Depends(get_user_from_token),
                       db: AsyncSession = Depends(get_db)) -> dict:
-    email = await check_like_for_del(token, post_id, db)
-    if email:
-        total_likes = await PostManager(db).remove_like(email, post_id)
-        return {post_id: total_likes}
+    total_likes = await rate_post(token, post_id, 'likes', False, db)
+    return {post_id: total_likes}
 
 
 @post_rout.post('/{post_id}/dis')
 async def add_dis(post_id: int, token: dict = Depends(get_user_from_token),
                   db: AsyncSession = Depends(get_db)) -> dict:
-    email = await check_dislike(token, post_id, db)
-    if email:
-        total_dis = await PostManager(db).add_dis(email, post_id)
-        return {post_id: total_dis}
+    total_dis = await rate_post(token, post_id, 'dis', True, db)
+    return {post_id: total_dis}
 
 
 @post_rout.delete('/{post_id}/dis')
 async def remove_dis(post_id: int, token: dict = Depends(get_user_from_token),
                      db: AsyncSession = Depends(get_db)) -> dict:
-    email = await check_dis_for_del(token, post_id, db)
-    if email:
-        total_dis = await PostManager(db).remove_dis(email, post_id)
-        return {post_id: total_dis}
+    total_dis = await rate_post(token, post_id, 'dis', False, db)
+    return {post_id: total_dis}
 
 
 @post_rout.get('/{post_id}/total_rate')
 async def show_like(post_id: int, token: dict = Depends(get_user_from_token)) -> dict:
-    return {
-        'total_likes': get_rate('likes', post_id),
-        'user_set_likes': show_reviewers('likes', post_id),
-        'total_dislikes': get_rate('dis', post_id),
-        'user_set_dislikes': show_reviewers('dis', post_id),
-            }
+    rates = await get_rates([post_id])
+    return rates[post_id]
+
+
+@post_rout.get('/{post_id}/reviewers')
+async def show_reviewers(post_id: int, rate_type: str = Query(default='likes', regex='^(likes|dis)$'),
+                         cursor: int = Query(ge=0, default=0),
+                         count: int = Query(ge=1, le=settings.REVIEWERS_PAGE_LIMIT,
+                                            default=settings.REVIEWERS_PAGE_LIMIT),
+                         token: dict = Depends(get_user_from_token)) -> dict:
+    next_cursor, reviewers = await scan_reviewers(rate_type, post_id, cursor, count)
+    return {'reviewers': reviewers, 'next_cursor': next_cursor}
+
+
+@post_rout.post('/total_rate')
+async def show_like_batch(post_ids: conlist(int, min_items=1, max_items=settings.TOTAL_RATE_BATCH_LIMIT) = Body(),
+                          token: dict = Depends(get_user_from_token)) -> dict:
+    # reviewers are paged per post by /post/{post_id}/reviewers, a batch of whole sets would be unbounded
+    return await get_rates(post_ids)
 
 
 app.include_router(post_rout)
@@ -0,0 +1,37 @@
+"""post filter indexes
+
+Revision ID: 1c9292bf2377
+Revises: 1f8f204d8e22
+Create Date: 2026-10-18 13:10:07.727376
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '1c9292bf2377'
+down_revision = '1f8f204d8e22'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = {
+    'ix_post_update_at_post_id': ['update_at', 'post_id'],
+    'ix_post_likes_count_post_id': ['likes_count', 'post_id'],
+    'ix_post_owner_id_created_at_post_id': ['owner_id', 'created_at', 'post_id'],
+    'ix_post_owner_id_update_at_post_id': ['owner_id', 'update_at', 'post_id'],
+    'ix_post_owner_id_likes_count_post_id': ['owner_id', 'likes_count', 'post_id'],
+}
+
+
+def upgrade() -> None:
+    # one index per filterable sort, with and without the owner prefix, built without locking out post writes
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'post', columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, 'post', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,34 @@
+"""post search vector
+
+Revision ID: 1f8f204d8e22
+Revises: 7f1608995fff
+Create Date: 2026-10-18 13:06:14.592643
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '1f8f204d8e22'
+down_revision = '7f1608995fff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('post', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', content), 'B')",
+        persisted=True
+    ), nullable=True))
+    # CREATE INDEX CONCURRENTLY can't run inside the migration transaction and doesn't block writes
+    with op.get_context().autocommit_block():
+        op.create_index('ix_post_search_vector', 'post', ['search_vector'], postgresql_using='gin',
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_post_search_vector', 'post', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('post', 'search_vector')
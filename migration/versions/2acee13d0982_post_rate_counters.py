@@ -0,0 +1,31 @@
+"""post rate counters
+
+Revision ID: 2acee13d0982
+Revises: 9e75fa57782e
+Create Date: 2026-10-18 12:44:56.195678
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2acee13d0982'
+down_revision = '9e75fa57782e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('post', sa.Column('likes_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('post', sa.Column('dislikes_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.execute(
+        'UPDATE post SET '
+        'likes_count = (SELECT count(*) FROM "like" WHERE "like".post_id = post.post_id), '
+        'dislikes_count = (SELECT count(*) FROM dislike WHERE dislike.post_id = post.post_id)'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('post', 'dislikes_count')
+    op.drop_column('post', 'likes_count')
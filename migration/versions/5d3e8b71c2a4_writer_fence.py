@@ -0,0 +1,28 @@
+"""writer fence
+
+Revision ID: 5d3e8b71c2a4
+Revises: 1c9292bf2377
+Create Date: 2026-10-18 16:02:41.318902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d3e8b71c2a4'
+down_revision = '1c9292bf2377'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('writer_fence',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('token', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('writer_fence')
@@ -0,0 +1,24 @@
+"""user token version
+
+Revision ID: 7f1608995fff
+Revises: 2acee13d0982
+Create Date: 2026-10-18 12:55:04.676447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f1608995fff'
+down_revision = '2acee13d0982'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('token_version', sa.Integer(), server_default=sa.text('0'), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'token_version')
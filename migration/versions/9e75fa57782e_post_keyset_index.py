@@ -0,0 +1,27 @@
+"""post keyset index
+
+Revision ID: 9e75fa57782e
+Revises: 45b499a98912
+Create Date: 2026-10-18 12:43:20.353822
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9e75fa57782e'
+down_revision = '45b499a98912'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # built concurrently so the post table stays writable, which needs to run outside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_post_created_at_post_id', 'post', ['created_at', 'post_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_post_created_at_post_id', table_name='post', postgresql_concurrently=True, if_exists=True)
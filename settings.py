@@ -12,14 +12,56 @@ class Settings(BaseSettings):
     DB: Optional[str]
     DB_TEST: Optional[str]
     DB_HOST: str
+    STORAGE_BACKEND: str = 'sql'
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 100
 
     REFRESH_TOKEN_EXPIRES_IN: int
     ACCESS_TOKEN_EXPIRES_IN: int
     ALGORITHM: str
     SECRET_KEY: str
+    TOKEN_CACHE_SIZE: int = 10000
 
     REDIS_HOST: str
     REDIS_PORT: int
+    REDIS_POOL_SIZE: int = 50
+    REDIS_POOL_TIMEOUT: int = 5
+
+    HASH_EXECUTOR: str = 'thread'
+    HASH_WORKERS: Optional[int]
+    HASH_QUEUE_LIMIT: int = 64
+
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: int = 30
+
+    POST_STREAM_CHUNK_SIZE: int = 500
+
+    RATE_WRITE_BEHIND: bool = False
+    RATE_STREAM: str = 'rates:stream'
+    RATE_STREAM_GROUP: str = 'rate-writer'
+    RATE_WRITER_BATCH_SIZE: int = 500
+    RATE_WRITER_FLUSH_INTERVAL: int = 1000
+    TOTAL_RATE_BATCH_LIMIT: int = 100
+    REVIEWERS_PAGE_LIMIT: int = 100
+
+    POST_CACHE_TTL: int = 300
+
+    REQUEST_ROUNDTRIP_BUDGET: int = 10
+
+    PROFILE_DIR: Optional[str]
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_MAX_FRACTION: float = 0.01
+    PROFILE_INTERVAL: float = 0.005
+    PROFILE_HEADER: str = 'X-Profile'
+
+    LOOP_WATCHDOG_THRESHOLD: float = 0.1
+    LOOP_WATCHDOG_INTERVAL: float = 0.05
+    LOOP_WATCHDOG_LOG_INTERVAL: float = 10.0
 
     class Config:
         env_file = '.env'
@@ -0,0 +1,22 @@
+from cache_redis.cache import RateCache, RedisRateCache
+from cache_redis.memory import MemoryRateCache
+from db.db_services import UserManager as SqlUserManager, PostManager as SqlPostManager
+from db.memory import MemoryUserManager, MemoryPostManager
+from settings import settings
+
+BACKENDS = {
+    'sql': (SqlUserManager, SqlPostManager, RedisRateCache),
+    'memory': (MemoryUserManager, MemoryPostManager, MemoryRateCache),
+}
+
+if settings.STORAGE_BACKEND not in BACKENDS:
+    raise ValueError(f'Unknown STORAGE_BACKEND {settings.STORAGE_BACKEND!r}, expected one of {", ".join(BACKENDS)}')
+if settings.STORAGE_BACKEND == 'memory' and settings.RATE_WRITE_BEHIND:
+    raise ValueError('RATE_WRITE_BEHIND needs the sql storage backend')
+
+UserManager, PostManager, RateCacheBackend = BACKENDS[settings.STORAGE_BACKEND]
+rate_cache: RateCache = RateCacheBackend()
+
+apply_rate = rate_cache.apply_rate
+get_rates = rate_cache.get_rates
+scan_reviewers = rate_cache.scan_reviewers
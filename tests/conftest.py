@@ -6,20 +6,26 @@ from typing import AsyncGenerator, Generator
 from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
 import pytest
-import redis
+from redis import asyncio as aioredis
 from sqlalchemy import insert, literal_column, text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from fastapi.testclient import TestClient
 
-from auth_backend.authenticate import create_token, create_refresh_token
+from auth_backend.authenticate import create_token, create_refresh_token, token_cache
 from db.db_schema import Post, User
-from db.db_services import PostManager
+from db.db_services import PostManager, principal_cache
 from settings import settings
 from db.db_config import get_db
 from main import app
 from models import UserModel, UserModelOutput
 
 
+@pytest.fixture(autouse=True)
+def clear_auth_caches() -> None:
+    principal_cache.clear()
+    token_cache.clear()
+
+
 @pytest.fixture(scope='function')
 async def setup_and_teardown_db() -> None:
     os.system('docker compose -f tests/docker-compose_test.yml up -d')
@@ -167,11 +173,18 @@ def setup_and_teardown_cache():
     os.system('docker compose -f tests/docker-compose_test_cache.yml down -v')
 
 
-@pytest.fixture(scope='class')
-def redis_session():
-    r = redis.Redis(host=settings.REDIS_HOST, port=6380, decode_responses=True)
+@pytest.fixture(scope='function')
+async def redis_session() -> AsyncGenerator[aioredis.Redis, None]:
+    r = aioredis.Redis(host=settings.REDIS_HOST, port=6380, decode_responses=True)
+    yield r
+    await r.close()
+
+
+@pytest.fixture(scope='function')
+async def raw_redis_session() -> AsyncGenerator[aioredis.Redis, None]:
+    r = aioredis.Redis(host=settings.REDIS_HOST, port=6380)
     yield r
-    r.close()
+    await r.close()
 
 
 @pytest.fixture(scope='function')
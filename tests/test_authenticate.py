@@ -1,6 +1,10 @@
 import pytest
 from fastapi import HTTPException
-from auth_backend.authenticate import authenticate, create_token, decode_token, get_user_from_token
+import uuid
+from datetime import timedelta
+from jose import JWTError
+from auth_backend.authenticate import authenticate, create_token, decode_token, get_user_from_token, user_claims, \
+    principal_from_claims, token_cache
 from db.db_services import UserManager
 from models import AuthUser, UserModel
 
@@ -25,8 +29,11 @@ async def test_authenticate(setup_and_teardown_db, password_create, email_create
             email=email_check,
             password=password_check
         )
-        flag = await authenticate(user_data, session)
-    assert flag == result
+        user, message = await authenticate(user_data, session)
+    assert (bool(user), message) == result
+    assert 'password' not in user
+    if user:
+        assert user.get('token_version') == 0
 
 
 async def test_create_token():
@@ -36,6 +43,59 @@ async def test_create_token():
     assert payload_from_token['exp']
 
 
+async def test_decode_token_cache():
+    token = create_token({'sub': 'foo@example.com'})
+    hits = token_cache.hits
+    payload = decode_token(token)
+    payload['sub'] = 'too@example.com'
+    assert decode_token(token).get('sub') == 'foo@example.com'
+    assert token_cache.hits == hits + 1
+    with pytest.raises(JWTError):
+        decode_token(token[:-2])
+
+
+async def test_decode_token_cache_expired():
+    token = create_token({'sub': 'foo@example.com'}, timedelta(seconds=-1))
+    with pytest.raises(JWTError):
+        decode_token(token)
+    size = len(token_cache)
+    with pytest.raises(JWTError):
+        decode_token(token)
+    assert len(token_cache) == size
+
+
+async def test_claims_token():
+    principal = {'email': 'foo@example.com', 'user_id': uuid.uuid4(), 'is_admin': True, 'token_version': 3}
+    payload = decode_token(create_token(user_claims(principal)))
+    assert payload.get('sub') == principal['email']
+    assert principal_from_claims(payload) == principal
+    with pytest.raises(HTTPException):
+        principal_from_claims({'sub': 'foo@example.com'})
+
+
+async def test_get_user_from_claims_token(setup_and_teardown_db):
+    user = UserModel(
+        first_name='foo',
+        last_name='foo',
+        password='Qwerty1234',
+        email='foo@example.com'
+    )
+    session = setup_and_teardown_db
+    async with session:
+        manager = UserManager(session)
+        await manager.create(user)
+        await session.commit()
+        token = create_token(user_claims(await manager.get_principal(user.email)))
+        user_data = await get_user_from_token(token, session)
+        assert user_data.get('email') == user.email
+        assert user_data.get('is_admin') is False
+        await manager.set_admin(user.email, True)
+        await session.commit()
+        with pytest.raises(HTTPException) as e:
+            await get_user_from_token(token, session)
+    assert e.value.status_code == 401
+
+
 async def test_get_user_from_token(setup_and_teardown_db):
     user = UserModel(
         first_name='foo',
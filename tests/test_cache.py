@@ -1,26 +1,113 @@
-from cache_redis.cache import add_rate, show_reviewers, check_exists_rate, get_rate, remove_rate
+import uuid
+from datetime import datetime
 
+from cache_redis import cache
+from cache_redis.cache import add_rate, show_reviewers, check_exists_rate, get_rate, remove_rate, apply_rate, \
+    get_rates, scan_reviewers, pack_post, unpack_post, get_cached_post, cache_post, bump_post_version
+from settings import settings
 
-def test_rate_op(setup_and_teardown_cache, monkeypatch, redis_session):
+
+async def test_rate_op(setup_and_teardown_cache, monkeypatch, redis_session):
     monkeypatch.setattr('cache_redis.cache.r', redis_session)
-    added = add_rate('likes', 1, 'foo@example.com')
+    added = await add_rate('likes', 1, 'foo@example.com')
     assert added == 1
-    added = add_rate('likes', 1, 'foo@example.com')
+    added = await add_rate('likes', 1, 'foo@example.com')
     assert added == 0
-    added = add_rate('likes', 2, 'foo@example.com')
+    added = await add_rate('likes', 2, 'foo@example.com')
     assert added == 1
-    add_rate('likes', 1, 'too@example.com')
-    likes = show_reviewers('likes', 1)
+    await add_rate('likes', 1, 'too@example.com')
+    likes = await show_reviewers('likes', 1)
     assert likes == {'foo@example.com', 'too@example.com'}
-    flag = check_exists_rate('likes', 1, 'foo@example.com')
+    flag = await check_exists_rate('likes', 1, 'foo@example.com')
     assert flag
-    flag = check_exists_rate('likes', 1, 'do@example.com')
+    flag = await check_exists_rate('likes', 1, 'do@example.com')
     assert not flag
-    length = get_rate('likes', 1)
+    length = await get_rate('likes', 1)
     assert length == 2
-    remove_rate('likes', 1, 'foo@example.com')
-    length = get_rate('likes', 1)
+    await remove_rate('likes', 1, 'foo@example.com')
+    length = await get_rate('likes', 1)
     assert length == 1
-    remove_rate('likes', 1, 'too@example.com')
-    length = get_rate('likes', 1)
+    await remove_rate('likes', 1, 'too@example.com')
+    length = await get_rate('likes', 1)
     assert length == 0
+
+
+async def test_pool_lifecycle():
+    client = cache.open_pool()
+    assert cache.r is client
+    assert cache.pool.max_connections == settings.REDIS_POOL_SIZE
+    assert cache.raw.connection_pool is cache.raw_pool
+    await cache.close_pool()
+    assert cache.r is None and cache.pool is None
+    assert cache.raw is None and cache.raw_pool is None
+
+
+async def test_apply_rate(setup_and_teardown_cache, monkeypatch, redis_session):
+    monkeypatch.setattr('cache_redis.cache.r', redis_session)
+    assert await apply_rate('likes', 3, 'foo@example.com', True) == (1, 1)
+    assert await apply_rate('likes', 3, 'foo@example.com', True) == (0, 1)
+    assert await apply_rate('dis', 3, 'foo@example.com', True) == (-1, 0)
+    assert await apply_rate('likes', 3, 'foo@example.com', False) == (1, 0)
+    assert await apply_rate('dis', 3, 'foo@example.com', True) == (1, 1)
+
+
+async def test_get_rates(setup_and_teardown_cache, monkeypatch, redis_session):
+    monkeypatch.setattr('cache_redis.cache.r', redis_session)
+    await add_rate('likes', 10, 'foo@example.com')
+    await add_rate('dis', 11, 'foo@example.com')
+    rates = await get_rates([10, 11, 12])
+    assert rates == {
+        10: {'total_likes': 1, 'total_dislikes': 0},
+        11: {'total_likes': 0, 'total_dislikes': 1},
+        12: {'total_likes': 0, 'total_dislikes': 0},
+    }
+
+
+async def test_scan_reviewers(setup_and_teardown_cache, monkeypatch, redis_session):
+    monkeypatch.setattr('cache_redis.cache.r', redis_session)
+    emails = {f'user{i}@example.com' for i in range(300)}
+    for email in emails:
+        await add_rate('likes', 20, email)
+    reviewers, cursor = set(), None
+    while cursor != 0:
+        cursor, page = await scan_reviewers('likes', 20, cursor or 0, 50)
+        assert len(page) < 100
+        reviewers.update(page)
+    assert reviewers == emails
+
+
+def test_pack_post():
+    post = {
+        'post_id': 1,
+        'title': 'test title',
+        'content': 'test content',
+        'created_at': datetime(2023, 7, 6, 3, 28, 33, 171803),
+        'update_at': datetime(2023, 7, 7, 3, 28, 33),
+        'owner_id': uuid.uuid4(),
+        'modify_id': uuid.uuid4(),
+    }
+    assert unpack_post(pack_post(post)) == post
+
+
+async def test_post_cache(setup_and_teardown_cache, monkeypatch, redis_session, raw_redis_session):
+    monkeypatch.setattr('cache_redis.cache.r', redis_session)
+    monkeypatch.setattr('cache_redis.cache.raw', raw_redis_session)
+    post = {
+        'post_id': 5,
+        'title': 'test title',
+        'content': 'test content',
+        'created_at': datetime(2023, 7, 6, 3, 28, 33),
+        'update_at': datetime(2023, 7, 6, 3, 28, 33),
+        'owner_id': uuid.uuid4(),
+        'modify_id': uuid.uuid4(),
+    }
+    assert await get_cached_post(5) == (0, None, 0, 0)
+    await cache_post(5, 0, post)
+    await add_rate('likes', 5, 'foo@example.com')
+    assert await get_cached_post(5) == (0, post, 1, 0)
+    await bump_post_version(5)
+    assert await get_cached_post(5) == (1, None, 1, 0)
+    assert await redis_session.ttl('post:5:version') > settings.POST_CACHE_TTL
+    await redis_session.set('post:5:v1', 'not a post')
+    assert await get_cached_post(5) == (1, None, 1, 0)
+    assert not await redis_session.exists('post:5:v1')
@@ -0,0 +1,41 @@
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from db.db_config import create_engine, pool_stats, InstrumentedPool
+from settings import settings
+
+
+def test_create_engine():
+    engine = create_engine(settings.DB_TEST)
+    assert isinstance(engine.pool, InstrumentedPool)
+    assert engine.echo is settings.DB_ECHO
+    assert engine.pool.size() == settings.DB_POOL_SIZE
+    assert engine.pool.max_overflow == settings.DB_MAX_OVERFLOW
+    assert engine.pool._timeout == settings.DB_POOL_TIMEOUT
+    assert engine.pool._recycle == settings.DB_POOL_RECYCLE
+    assert engine.pool._pre_ping is settings.DB_POOL_PRE_PING
+
+
+def test_create_engine_overrides():
+    engine = create_engine(settings.DB_TEST, pool_size=2, max_overflow=0, echo=True)
+    assert engine.pool.size() == 2
+    assert engine.echo is True
+
+
+def test_pool_stats():
+    engine = create_engine(settings.DB_TEST, pool_size=4, max_overflow=4)
+    stats = pool_stats(engine)
+    assert stats['size'] == 4
+    assert stats['checked_out'] == 0
+    assert stats['saturation'] == 0.0
+    assert stats['checkouts'] == 0
+    assert stats['wait_avg'] == 0.0
+
+
+def test_pool_wait_excludes_connecting(monkeypatch):
+    engine = create_engine(settings.DB_TEST, pool_size=1, max_overflow=0)
+    monkeypatch.setattr(AsyncAdaptedQueuePool, '_create_connection', lambda pool: time.sleep(.05) or 'connection')
+    assert engine.pool._do_get() == 'connection'
+    assert engine.pool.checkouts == 1
+    assert engine.pool.wait_max < .05
@@ -1,11 +1,15 @@
+import itertools
 import uuid
+from datetime import datetime
 
 import pytest
-from sqlalchemy import insert, select
+from sqlalchemy import select, update, text
 
+from cache_redis.cache import get_cached_post
 from db.db_schema import Post, Like, Dislike
-from db.db_services import UserManager, PostManager
+from db.db_services import UserManager, PostManager, principal_cache
 from models import UserModel, UserModelOutput, AuthUser, UserToken, PostModel, UpdatePostModel
+from utils.paginations import PostFilter
 
 
 async def test_create_user(setup_and_teardown_db):
@@ -54,12 +58,19 @@ async def test_get_posts_many(setup_and_teardown_db, stub_user_posts):
     assert len(result) == 10
 
 
+async def test_stream_posts_many(setup_and_teardown_db, stub_user_posts):
+    session = setup_and_teardown_db
+    result = [post async for post in PostManager(session).stream_many(chunk_size=3)]
+    assert [post.get('post_id') for post in result] == list(range(1, 11))
+    assert all(isinstance(post, dict) for post in result)
+
+
 @pytest.mark.parametrize('page, limit, expected_len, expected_check',
                          [
                              (0, 10, 10, 1),
-                             (1, 5, 4, 7),
-                             (2, 2, 2, 6),
-                             (8, 1, 1, 10)
+                             (1, 5, 5, 6),
+                             (2, 2, 2, 5),
+                             (8, 1, 1, 9)
                          ]
                          )
 async def test_get_posts_many_filter(setup_and_teardown_db, stub_user_posts, page, limit, expected_len, expected_check):
@@ -69,12 +80,134 @@ async def test_get_posts_many_filter(setup_and_teardown_db, stub_user_posts, pag
     assert len(result) == expected_len
 
 
+async def test_get_posts_many_cursor(setup_and_teardown_db, stub_user_posts):
+    session = setup_and_teardown_db
+    manager = PostManager(session)
+    first_page = await manager.get_many_filter(0, 4)
+    assert [post.get('post_id') for post in first_page] == [1, 2, 3, 4]
+    last = first_page[-1]
+    cursor = (last.get('created_at'), last.get('post_id'))
+    second_page = await manager.get_many_filter(0, 4, cursor)
+    assert [post.get('post_id') for post in second_page] == [5, 6, 7, 8]
+    assert await manager.get_many_filter(0, 4, (datetime.max, 0)) == []
+
+
+def post_filter(**values) -> PostFilter:
+    fields = ('owner_id', 'created_since', 'created_before', 'updated_since', 'updated_before')
+    return PostFilter(**{field: values.get(field) for field in fields})
+
+
+async def test_get_posts_many_filter_sorted(setup_and_teardown_db, stub_user_posts, add_stub_user):
+    session = setup_and_teardown_db
+    manager = PostManager(session)
+    await manager.add_like('foo@example.com', 4)
+    await manager.add_like('foo@example.com', 7)
+    await manager.add_like('boo@example.com', 7)
+    page = await manager.get_many_filter(0, 3, sort='likes_count', descending=True)
+    assert [post.get('post_id') for post in page] == [7, 4, 10]
+    cursor = (page[-1].get('likes_count'), page[-1].get('post_id'))
+    page = await manager.get_many_filter(0, 3, cursor, sort='likes_count', descending=True)
+    assert [post.get('post_id') for post in page] == [9, 8, 6]
+    owner_id = (await manager.get(1)).get('owner_id')
+    assert len(await manager.get_many_filter(0, 20, filters=post_filter(owner_id=owner_id))) == 10
+    assert await manager.get_many_filter(0, 20, filters=post_filter(owner_id=uuid.uuid4())) == []
+    await session.execute(update(Post).where(Post.post_id <= 4).values(created_at=datetime(2023, 1, 1)))
+    page = await manager.get_many_filter(0, 20, filters=post_filter(created_before=datetime(2023, 1, 2)))
+    assert [post.get('post_id') for post in page] == [1, 2, 3, 4]
+
+
+RANGE_FILTERS = {
+    'created_since': datetime(2000, 1, 1),
+    'created_before': datetime(2100, 1, 1),
+    'updated_since': datetime(2000, 1, 1),
+    'updated_before': datetime(2100, 1, 1),
+}
+
+
+@pytest.mark.parametrize('owner, sort, descending, range_filter', list(itertools.product(
+    (False, True),
+    ('created_at', 'update_at', 'likes_count'),
+    (False, True),
+    (None, *RANGE_FILTERS),
+)))
+async def test_get_posts_many_filter_plan(setup_and_teardown_db, stub_user_posts, owner, sort, descending,
+                                          range_filter):
+    session = setup_and_teardown_db
+    values = {'owner_id': (await PostManager(session).get(1)).get('owner_id')} if owner else {}
+    if range_filter:
+        values[range_filter] = RANGE_FILTERS[range_filter]
+    query = PostManager.filter_query(0, 20, filters=post_filter(**values), sort=sort, descending=descending)
+    sql = query.compile(dialect=session.bind.dialect, compile_kwargs={'literal_binds': True})
+    # the stub table is too small for real costs, sorting is only disabled to prove an index can serve the order
+    await session.execute(text('SET LOCAL enable_seqscan = off'))
+    await session.execute(text('SET LOCAL enable_sort = off'))
+    plan = '\n'.join((await session.execute(text(f'EXPLAIN {sql}'))).scalars())
+    # a range on any timestamp stays a filter on the [owner_id,] <sort>, post_id index
+    assert f'ix_post_{"owner_id_" if owner else ""}{sort}_post_id' in plan
+    assert 'Sort Key' not in plan
+
+
+async def test_search_posts(setup_and_teardown_db, stub_user_posts):
+    session = setup_and_teardown_db
+    manager = PostManager(session)
+    assert [post.get('post_id') for post in await manager.search('title 3', 10)] == [3]
+    first_page = await manager.search('content', 4)
+    assert [post.get('post_id') for post in first_page] == [10, 9, 8, 7]
+    assert 'search_vector' not in first_page[0]
+    cursor = (first_page[-1].get('rank'), first_page[-1].get('post_id'))
+    assert [post.get('post_id') for post in await manager.search('content', 4, cursor)] == [6, 5, 4, 3]
+    assert await manager.search('missing', 4) == []
+
+
+async def test_rate_counters(setup_and_teardown_db, stub_user_posts, add_stub_user):
+    session = setup_and_teardown_db
+    manager = PostManager(session)
+    assert await manager.add_like('foo@example.com', 1) == 1
+    assert await manager.add_dis('foo@example.com', 2) == 1
+    post = await session.execute(select(Post.likes_count, Post.dislikes_count).where(Post.post_id == 1))
+    assert tuple(post.fetchone()) == (1, 0)
+    assert await manager.remove_like('foo@example.com', 1) == 0
+    assert await manager.remove_like('foo@example.com', 1) == 0
+
+
+async def test_rate(setup_and_teardown_db, stub_user_posts, add_stub_user):
+    session = setup_and_teardown_db
+    manager = PostManager(session)
+    owner = await session.execute(select(Post.owner_id).where(Post.post_id == 1))
+    owner_id = owner.scalar()
+    result = await manager.rate(Like, 'boo@example.com', 1, True, owner_id)
+    assert result.get('owner_id') == owner_id
+    assert result.get('changed') == 0
+    result = await manager.rate(Like, 'foo@example.com', 1, True, uuid.uuid4())
+    assert (result.get('changed'), result.get('total')) == (1, 1)
+    result = await manager.rate(Like, 'foo@example.com', 1, True, uuid.uuid4())
+    assert (result.get('changed'), result.get('total')) == (0, 1)
+    assert await manager.rate(Like, 'foo@example.com', 100, True, uuid.uuid4()) is None
+
+
 async def test_get_post(setup_and_teardown_db, stub_user_posts):
     session = setup_and_teardown_db
     post = await PostManager(session).get(1)
     assert post.get('post_id') == 1
 
 
+async def test_get_post_cached(setup_and_teardown_db, setup_and_teardown_cache, stub_user_posts, monkeypatch,
+                               redis_session, raw_redis_session):
+    monkeypatch.setattr('cache_redis.cache.r', redis_session)
+    monkeypatch.setattr('cache_redis.cache.raw', raw_redis_session)
+    session = setup_and_teardown_db
+    manager = PostManager(session)
+    post = await manager.get(1)
+    assert post.get('title') == 'test title 1'
+    await session.execute(update(Post).where(Post.post_id == 1).values(title='changed behind the cache'))
+    assert (await manager.get(1)).get('title') == 'test title 1'
+    await manager.update(1, UpdatePostModel(title='changed'))
+    assert (await manager.get(1)).get('title') == 'changed'
+    assert (await get_cached_post(1))[1] is None
+    await manager.delete(1)
+    assert await manager.get(1) == {}
+
+
 async def test_create_post(setup_and_teardown_db, get_stub_user):
     user = get_stub_user
     session = setup_and_teardown_db
@@ -141,8 +274,7 @@ async def test_add_dis(setup_and_teardown_db, stub_user_posts, add_stub_user):
 
 async def test_remove_like(setup_and_teardown_db, stub_user_posts, add_stub_user):
     session = setup_and_teardown_db
-    query = insert(Like).values(post_id=1, reviewer='foo@example.com')
-    await session.execute(query)
+    await PostManager(session).add_like('foo@example.com', 1)
     query = select(Like).where(Like.post_id == 1)
     like = await session.execute(query)
     likes = like.scalars()
@@ -156,8 +288,7 @@ async def test_remove_like(setup_and_teardown_db, stub_user_posts, add_stub_user
 
 async def test_remove_dis(setup_and_teardown_db, stub_user_posts, add_stub_user):
     session = setup_and_teardown_db
-    query = insert(Dislike).values(post_id=1, reviewer='foo@example.com')
-    await session.execute(query)
+    await PostManager(session).add_dis('foo@example.com', 1)
     query = select(Dislike).where(Dislike.post_id == 1)
     dis = await session.execute(query)
     dislikes = dis.scalars()
@@ -167,3 +298,20 @@ async def test_remove_dis(setup_and_teardown_db, stub_user_posts, add_stub_user)
     dis = await session.execute(query)
     dislikes = dis.scalars()
     assert [dis.reviewer for dis in dislikes] == []
+
+
+async def test_get_principal(setup_and_teardown_db, get_stub_user):
+    session = setup_and_teardown_db
+    manager = UserManager(session)
+    await manager.create(get_stub_user)
+    principal = await manager.get_principal(get_stub_user.email)
+    assert 'password' not in principal
+    assert not principal.get('is_admin')
+    assert principal_cache.get(get_stub_user.email) == principal
+    await manager.set_admin(get_stub_user.email, True)
+    assert principal_cache.get(get_stub_user.email) is None
+    principal = await manager.get_principal(get_stub_user.email)
+    assert principal.get('is_admin')
+    assert principal.get('token_version') == 1
+    await manager.revoke_tokens(get_stub_user.email)
+    assert await manager.get_token_version(get_stub_user.email) == 2
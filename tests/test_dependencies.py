@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from settings import settings
+from utils.dependencies import rate_post, is_owner
+
+user = {'user_id': uuid.uuid4(), 'email': 'foo@example.com', 'is_admin': False}
+
+
+@pytest.mark.parametrize('rate_type, add, row, cache_result, expected', [
+    ('likes', True, {'owner_id': uuid.uuid4(), 'changed': 1, 'total': 5}, (1, 5), 5),
+    ('dis', False, {'owner_id': uuid.uuid4(), 'changed': 1, 'total': 0}, (1, 0), 0),
+    ('likes', True, None, None, (404, 'Post 1 doesn\'\t exists')),
+    ('likes', True, {'owner_id': user['user_id'], 'changed': 0, 'total': 0}, None,
+     (400, 'You couldn\'t rate your own posts')),
+    ('likes', True, {'owner_id': uuid.uuid4(), 'changed': 0, 'total': 1}, None, (400, 'Already liked')),
+    ('dis', True, {'owner_id': uuid.uuid4(), 'changed': 1, 'total': 1}, (-1, 0), (400, 'Already liked')),
+    ('dis', False, {'owner_id': uuid.uuid4(), 'changed': 0, 'total': 0}, None,
+     (400, 'You haven\'t disliked it before\'\t exists')),
+])
+async def test_rate_post(mocker, rate_type, add, row, cache_result, expected):
+    mocker.patch('utils.dependencies.PostManager.rate', return_value=row)
+    apply_rate = mocker.patch('utils.dependencies.apply_rate', return_value=cache_result)
+    if isinstance(expected, tuple):
+        with pytest.raises(HTTPException) as e:
+            await rate_post(user, 1, rate_type, add, None)
+        assert (e.value.status_code, e.value.detail) == expected
+    else:
+        assert await rate_post(user, 1, rate_type, add, None) == expected
+        apply_rate.assert_awaited_once_with(rate_type, 1, user['email'], add)
+
+
+@pytest.mark.parametrize('post, cache_result, expected', [
+    ({'owner_id': uuid.uuid4()}, (1, 3), 3),
+    ({}, None, (404, 'Post 1 doesn\'\t exists')),
+    ({'owner_id': user['user_id']}, None, (400, 'You couldn\'t rate your own posts')),
+    ({'owner_id': uuid.uuid4()}, (0, 3), (400, 'Already liked')),
+    ({'owner_id': uuid.uuid4()}, (-1, 3), (400, 'Already disliked')),
+])
+async def test_rate_post_behind(mocker, monkeypatch, post, cache_result, expected):
+    monkeypatch.setattr('utils.dependencies.settings.RATE_WRITE_BEHIND', True)
+    mocker.patch('utils.dependencies.PostManager.get', return_value=post)
+    apply_rate = mocker.patch('utils.dependencies.apply_rate', return_value=cache_result)
+    if isinstance(expected, tuple):
+        with pytest.raises(HTTPException) as e:
+            await rate_post(user, 1, 'likes', True, None)
+        assert (e.value.status_code, e.value.detail) == expected
+    else:
+        assert await rate_post(user, 1, 'likes', True, None) == expected
+        apply_rate.assert_awaited_once_with('likes', 1, user['email'], True, settings.RATE_STREAM)
+
+
+@pytest.mark.parametrize('token, post, expected', [
+    (user, {'owner_id': user['user_id']}, (user['user_id'], False)),
+    (dict(user, is_admin=True), {'owner_id': uuid.uuid4()}, (user['user_id'], True)),
+    (user, {'owner_id': uuid.uuid4()}, (403, 'You haven\'t permission for modify 1')),
+    (user, {}, (404, 'Post 1 doesn\'\t exists')),
+])
+async def test_is_owner(mocker, token, post, expected):
+    mocker.patch('utils.dependencies.PostManager.get', return_value=post)
+    get_user = mocker.patch('utils.dependencies.UserManager.get')
+    if isinstance(expected[0], int):
+        with pytest.raises(HTTPException) as e:
+            await is_owner(token, 1, None)
+        assert (e.value.status_code, e.value.detail) == expected
+    else:
+        assert await is_owner(token, 1, None) == expected
+    get_user.assert_not_called()
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import pytest
+from starlette.requests import Request
+
+from utils.etag import post_etag, list_etag, not_modified
+
+post = {'post_id': 1, 'update_at': datetime(2023, 7, 6, 3, 28, 33, 171803), 'likes_count': 1, 'dislikes_count': 0}
+
+
+def make_request(headers: dict) -> Request:
+    return Request({'type': 'http', 'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+
+
+def test_post_etag():
+    assert post_etag(post) == post_etag(dict(post))
+    assert post_etag(post) != post_etag({**post, 'update_at': datetime(2023, 7, 6, 3, 28, 34)})
+    assert post_etag(post) != post_etag({**post, 'likes_count': 2})
+    assert list_etag([post]) != list_etag([post, {**post, 'post_id': 2}])
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({}, False),
+    ({'If-None-Match': post_etag(post)}, True),
+    ({'If-None-Match': f'"other", W/{post_etag(post)}'}, True),
+    ({'If-None-Match': '*'}, True),
+    ({'If-None-Match': '"other"'}, False),
+    ({'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}, False),
+    ({'If-None-Match': '"other"', 'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}, False),
+])
+def test_not_modified(headers, expected):
+    assert not_modified(make_request(headers), post_etag(post)) == expected
+
@@ -1,4 +1,5 @@
-from utils.hasher import hash_pass, check_hash
+import asyncio
+from utils.hasher import hash_pass, check_hash, HashService, HashPoolSaturated
 import pytest
 from models import UserModel
 
@@ -19,3 +20,22 @@ def test_hashing(password):
         )
     hashed = hash_pass(user.password)
     assert check_hash(password, hashed)
+
+
+async def test_hash_service():
+    service = HashService('thread', workers=2, queue_limit=1)
+    hashed = await service.hash_pass('Qwerty1234')
+    assert await service.check_hash('Qwerty1234', hashed)
+    assert not await service.check_hash('qwertY1234', hashed)
+    stats = service.stats()
+    assert stats['completed'] == 3
+    assert stats['in_flight'] == 0
+    service.shutdown()
+
+
+async def test_hash_service_saturated():
+    service = HashService('thread', workers=1, queue_limit=1)
+    results = await asyncio.gather(*[service.hash_pass('Qwerty1234') for _ in range(3)], return_exceptions=True)
+    assert sum(isinstance(result, HashPoolSaturated) for result in results) == 1
+    assert service.stats()['rejected'] == 1
+    service.shutdown()
@@ -1,12 +1,15 @@
 import asyncio
 import copy
+import json
 import time
 
 import pytest
+import redis
 from starlette.testclient import TestClient
 
 from db.db_schema import Post
 from models import UserModel, PostModel, UpdatePostModel
+from settings import settings
 
 
 @pytest.mark.usefixtures('setup_and_teardown_db_integrity', 'setup_and_teardown_cache', 'get_client', 'get_stub_user',
@@ -65,10 +68,18 @@ class TestIntegrityAPI:
         assert response.status_code == 200
         assert len(response.json()) == 11
 
+    async def test_read_posts_stream(self, get_client: TestClient):
+        header = {'Authorization': f'bearer {self.access_token}', 'Accept': 'application/x-ndjson'}
+        response = get_client.get('/post', headers=header)
+        assert response.status_code == 200
+        assert response.headers.get('content-type') == 'application/x-ndjson'
+        posts = [json.loads(line) for line in response.text.splitlines()]
+        assert len(posts) == 11
+
     @pytest.mark.parametrize('page, limit, length, expected, exp_code', [
         (0, 5, 5, range(1, 6), 200),
-        (1, 10, None, None, 404),
-        (2, 2, 2, range(6, 8), 200),
+        (2, 10, None, None, 404),
+        (2, 2, 2, range(5, 7), 200),
         (0, 100, 11, range(1, 12), 200),
         (0, 0, None, None, 422)
     ]
@@ -81,12 +92,66 @@ class TestIntegrityAPI:
             assert len(response.json()) == length
             assert [int(post.get('title').split(' ')[2]) for post in response.json()] == list(expected)
 
+    async def test_read_posts_cursor(self, get_client: TestClient):
+        header = {'Authorization': f'bearer {self.access_token}'}
+        response = get_client.get('/post/filter?limit=6', headers=header)
+        cursor = response.headers.get('X-Next-Cursor')
+        assert cursor
+        response = get_client.get(f'/post/filter?limit=6&cursor={cursor}', headers=header)
+        assert response.status_code == 200
+        assert [int(post.get('title').split(' ')[2]) for post in response.json()] == list(range(7, 12))
+        assert not response.headers.get('X-Next-Cursor')
+        response = get_client.get('/post/filter?limit=6&cursor=broken', headers=header)
+        assert response.status_code == 400
+
+    async def test_read_posts_filter_sorted(self, get_client: TestClient):
+        header = {'Authorization': f'bearer {self.access_token}'}
+        response = get_client.get('/post/filter?limit=3&sort=update_at&order=desc', headers=header)
+        assert response.status_code == 200
+        assert [post.get('post_id') for post in response.json()] == [11, 10, 9]
+        cursor = response.headers.get('X-Next-Cursor')
+        response = get_client.get(f'/post/filter?limit=3&sort=update_at&order=desc&cursor={cursor}', headers=header)
+        assert [post.get('post_id') for post in response.json()] == [8, 7, 6]
+        owner_id = response.json()[0].get('owner_id')
+        response = get_client.get(f'/post/filter?limit=20&owner_id={owner_id}&created_before=2000-01-01T00:00:00',
+                                  headers=header)
+        assert response.status_code == 404
+        assert get_client.get('/post/filter?limit=3&sort=title', headers=header).status_code == 422
+
+    async def test_search_posts(self, get_client: TestClient):
+        header = {'Authorization': f'bearer {self.access_token}'}
+        response = get_client.get('/post/search?q=content&limit=6', headers=header)
+        assert response.status_code == 200
+        assert [post.get('post_id') for post in response.json()] == list(range(11, 5, -1))
+        cursor = response.headers.get('X-Next-Cursor')
+        response = get_client.get(f'/post/search?q=content&limit=6&cursor={cursor}', headers=header)
+        assert [post.get('post_id') for post in response.json()] == list(range(5, 0, -1))
+        assert not response.headers.get('X-Next-Cursor')
+        assert get_client.get('/post/search?q=', headers=header).status_code == 422
+
     async def test_read_post(self, get_client: TestClient):
         response = get_client.get('/post/1', headers={'Authorization': f'bearer {self.access_token}'})
-        assert len(response.json()) == 7
+        assert len(response.json()) == 9
         assert response.status_code == 200
         assert int(response.json().get('title').split(' ')[2]) == 1
 
+    async def test_read_post_not_modified(self, get_client: TestClient):
+        header = {'Authorization': f'bearer {self.access_token}'}
+        response = get_client.get('/post/1', headers=header)
+        etag = response.headers.get('ETag')
+        assert etag and not response.headers.get('Last-Modified')
+        response = get_client.get('/post/1', headers={**header, 'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers.get('ETag') == etag
+        response = get_client.get('/post/1', headers={**header, 'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+        assert response.status_code == 200
+        response = get_client.get('/post/1', headers={**header, 'If-None-Match': '"stale"'})
+        assert response.status_code == 200
+        response = get_client.get('/post/filter?limit=5', headers=header)
+        response = get_client.get('/post/filter?limit=5',
+                                  headers={**header, 'If-None-Match': response.headers.get('ETag')})
+        assert response.status_code == 304
+
     @pytest.mark.parametrize('post_id, expected_result, expected_code', [
         (1, 'You haven\'t permission for modify 1', 403),
         (11, None, 200)
@@ -159,12 +224,40 @@ class TestIntegrityAPI:
     async def test_show_like(self, monkeypatch, redis_session, get_client: TestClient, post_id=1):
         expected_result = {
         'total_likes': 0,
-        'user_set_likes': [],
         'total_dislikes': 0,
-        'user_set_dislikes': [],
             }
         monkeypatch.setattr('cache_redis.cache.r', redis_session)
         response = get_client.get(f'/post/{post_id}/total_rate',
                                   headers={'Authorization': f'bearer {self.access_token}'})
         assert response.status_code == 200
         assert response.json() == expected_result
+
+    async def test_show_like_batch(self, monkeypatch, redis_session, get_client: TestClient):
+        monkeypatch.setattr('cache_redis.cache.r', redis_session)
+        header = {'Authorization': f'bearer {self.access_token}'}
+        response = get_client.post('/post/total_rate', headers=header, json=[1, 2])
+        assert response.status_code == 200
+        assert response.json() == {
+            '1': {'total_likes': 0, 'total_dislikes': 0},
+            '2': {'total_likes': 0, 'total_dislikes': 0},
+        }
+        response = get_client.post('/post/total_rate', headers=header, json=[])
+        assert response.status_code == 422
+
+    async def test_show_reviewers(self, monkeypatch, redis_session, get_client: TestClient):
+        monkeypatch.setattr('cache_redis.cache.r', redis_session)
+        emails = {f'user{i}@example.com' for i in range(5)}
+        seed = redis.Redis(host=settings.REDIS_HOST, port=6380)
+        seed.sadd('likes:3:set', *emails)
+        seed.close()
+        header = {'Authorization': f'bearer {self.access_token}'}
+        reviewers, cursor = set(), None
+        while cursor != 0:
+            response = get_client.get(f'/post/3/reviewers?rate_type=likes&cursor={cursor or 0}&count=2',
+                                      headers=header)
+            assert response.status_code == 200
+            reviewers.update(response.json().get('reviewers'))
+            cursor = response.json().get('next_cursor')
+        assert reviewers == emails
+        response = get_client.get('/post/3/reviewers?count=1000', headers=header)
+        assert response.status_code == 422
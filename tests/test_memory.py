@@ -0,0 +1,213 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from starlette.testclient import TestClient
+
+from cache_redis.memory import MemoryRateCache
+from db.db_config import get_db
+from db.db_schema import Like, Dislike
+from db.memory import MemorySession, MemoryStore, MemoryUserManager, MemoryPostManager
+from main import app
+from models import UserModel, UserToken, PostModel, UpdatePostModel
+from utils.paginations import PostFilter
+
+
+@pytest.fixture()
+def memory_session() -> MemorySession:
+    return MemorySession(MemoryStore())
+
+
+@pytest.fixture()
+def memory_app(monkeypatch) -> TestClient:
+    memory_store, rate_cache = MemoryStore(), MemoryRateCache()
+    for target in ('main.UserManager', 'auth_backend.authenticate.UserManager', 'utils.dependencies.UserManager'):
+        monkeypatch.setattr(target, MemoryUserManager)
+    for target in ('main.PostManager', 'utils.dependencies.PostManager'):
+        monkeypatch.setattr(target, MemoryPostManager)
+    monkeypatch.setattr('utils.dependencies.apply_rate', rate_cache.apply_rate)
+    monkeypatch.setattr('main.get_rates', rate_cache.get_rates)
+    monkeypatch.setattr('main.scan_reviewers', rate_cache.scan_reviewers)
+
+    async def memory_db():
+        session = MemorySession(memory_store)
+        try:
+            yield session
+            await session.commit()
+        finally:
+            await session.close()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = memory_db
+    yield TestClient(app)
+    app.dependency_overrides = overrides
+
+
+async def create_user(session: MemorySession, email: str = 'foo@example.com') -> dict:
+    user = UserModel(first_name='foo', last_name='foo', password='Qwerty1234', email=email)
+    await MemoryUserManager(session).create(user)
+    return await MemoryUserManager(session).get(UserToken(email=email))
+
+
+async def create_posts(session: MemorySession, owner_id: uuid.UUID, count: int) -> list[int]:
+    manager = MemoryPostManager(session)
+    return [await manager.create(PostModel(title=f'title {i}', content=f'content {i}', owner_id=owner_id,
+                                           modify_id=owner_id)) for i in range(count)]
+
+
+async def test_user_manager(memory_session):
+    user = await create_user(memory_session)
+    assert user.get('password') != 'Qwerty1234'
+    manager = MemoryUserManager(memory_session)
+    with pytest.raises(IntegrityError):
+        await create_user(memory_session)
+    await manager.set_admin(user.get('email'), True)
+    principal = await manager.get_principal(user.get('email'))
+    assert principal.get('is_admin')
+    assert principal.get('token_version') == 1
+    assert 'password' not in principal
+
+
+async def test_session_rollback(memory_session):
+    user = await create_user(memory_session)
+    await memory_session.commit()
+    post_ids = await create_posts(memory_session, user.get('user_id'), 2)
+    await MemoryPostManager(memory_session).add_like('too@example.com', post_ids[0])
+    await memory_session.close()
+    assert memory_session.store.posts == {}
+    assert memory_session.store.created_index == []
+    assert memory_session.store.rates['like'] == {post_ids[0]: set()}
+    assert await MemoryUserManager(memory_session).get(UserToken(email=user.get('email')))
+
+
+async def test_concurrent_create_user():
+    memory_store = MemoryStore()
+    results = await asyncio.gather(create_user(MemorySession(memory_store)), create_user(MemorySession(memory_store)),
+                                   return_exceptions=True)
+    assert sum(isinstance(result, IntegrityError) for result in results) == 1
+    assert list(memory_store.users) == ['foo@example.com']
+
+
+async def test_rollback_keeps_other_sessions(memory_session):
+    user = await create_user(memory_session)
+    post_id = (await create_posts(memory_session, user.get('user_id'), 1))[0]
+    await memory_session.commit()
+    other = MemorySession(memory_session.store)
+    await MemoryPostManager(memory_session).add_like('too@example.com', post_id)
+    await MemoryPostManager(other).add_like('bar@example.com', post_id)
+    await MemoryPostManager(other).update(post_id, UpdatePostModel(title='changed'))
+    await other.commit()
+    await memory_session.rollback()
+    post = memory_session.store.posts[post_id]
+    assert (post['likes_count'], post['title']) == (1, 'changed')
+    assert memory_session.store.rates['like'][post_id] == {'bar@example.com'}
+
+
+async def test_post_manager(memory_session):
+    user = await create_user(memory_session)
+    post_ids = await create_posts(memory_session, user.get('user_id'), 9)
+    manager = MemoryPostManager(memory_session)
+    page = await manager.get_many_filter(1, 4)
+    assert [post.get('post_id') for post in page] == post_ids[4:8]
+    cursor = (page[-1].get('created_at'), page[-1].get('post_id'))
+    assert [post.get('post_id') for post in await manager.get_many_filter(0, 4, cursor)] == post_ids[8:]
+    assert len([post async for post in manager.stream_many(2)]) == 9
+    await manager.update(post_ids[0], UpdatePostModel(title='new title'))
+    post = await manager.get(post_ids[0])
+    assert post.get('title') == 'new title'
+    assert post.get('update_at') > post.get('created_at')
+    await manager.delete(post_ids[1])
+    assert await manager.get(post_ids[1]) == {}
+    assert len(await manager.get_many()) == 8
+
+
+async def test_post_manager_filter(memory_session):
+    user, other = await create_user(memory_session), await create_user(memory_session, 'bar@example.com')
+    post_ids = await create_posts(memory_session, user.get('user_id'), 4)
+    other_ids = await create_posts(memory_session, other.get('user_id'), 2)
+    manager = MemoryPostManager(memory_session)
+    for post_id in (post_ids[1], post_ids[2], other_ids[0]):
+        await manager.add_like('baz@example.com', post_id)
+    await manager.add_like('bar@example.com', post_ids[2])
+    filters = PostFilter(owner_id=user.get('user_id'), created_since=None, created_before=None, updated_since=None,
+                         updated_before=None)
+    page = await manager.get_many_filter(0, 2, None, filters, 'likes_count', True)
+    assert [post.get('post_id') for post in page] == [post_ids[2], post_ids[1]]
+    cursor = (page[-1].get('likes_count'), page[-1].get('post_id'))
+    page = await manager.get_many_filter(0, 2, cursor, filters, 'likes_count', True)
+    assert [post.get('post_id') for post in page] == [post_ids[3], post_ids[0]]
+    created_at = (await manager.get(other_ids[0])).get('created_at')
+    filters = PostFilter(owner_id=None, created_since=created_at, created_before=None, updated_since=None,
+                         updated_before=None)
+    assert [post.get('post_id') for post in await manager.get_many_filter(0, 5, None, filters)] == other_ids
+
+
+async def test_search(memory_session):
+    user = await create_user(memory_session)
+    post_ids = await create_posts(memory_session, user.get('user_id'), 5)
+    manager = MemoryPostManager(memory_session)
+    await manager.update(post_ids[0], UpdatePostModel(content='title content'))
+    assert [post.get('post_id') for post in await manager.search('title 3', 5)] == [post_ids[3]]
+    page = await manager.search('title', 2)
+    assert [post.get('post_id') for post in page] == [post_ids[0], post_ids[4]]
+    cursor = (page[-1].get('rank'), page[-1].get('post_id'))
+    assert [post.get('post_id') for post in await manager.search('title', 5, cursor)] == post_ids[3:0:-1]
+
+
+async def test_rate(memory_session):
+    user = await create_user(memory_session)
+    post_id, = await create_posts(memory_session, user.get('user_id'), 1)
+    manager = MemoryPostManager(memory_session)
+    result = await manager.rate(Like, user.get('email'), post_id, True, user.get('user_id'))
+    assert result == {'owner_id': user.get('user_id'), 'changed': 0, 'total': 0}
+    assert await manager.add_like('too@example.com', post_id) == 1
+    assert (await manager.rate(Like, 'too@example.com', post_id, True)).get('changed') == 0
+    await create_user(memory_session, 'bar@example.com')
+    await manager.apply_rates(Dislike, {(post_id, 'bar@example.com'): True, (post_id, 'baz@example.com'): True})
+    assert (await manager.get_stamp(post_id)).get('dislikes_count') == 1
+    with pytest.raises(IntegrityError):
+        await manager.delete(post_id)
+
+
+async def test_rate_cache():
+    cache = MemoryRateCache()
+    assert await cache.apply_rate('likes', 1, 'foo@example.com', True) == (1, 1)
+    assert await cache.apply_rate('likes', 1, 'foo@example.com', True) == (0, 1)
+    assert await cache.apply_rate('dis', 1, 'foo@example.com', True) == (-1, 0)
+    for i in range(5):
+        await cache.apply_rate('likes', 1, f'user{i}@example.com', True)
+    rates = await cache.get_rates([1, 2])
+    assert rates == {1: {'total_likes': 6, 'total_dislikes': 0}, 2: {'total_likes': 0, 'total_dislikes': 0}}
+    cursor, reviewers = await cache.scan_reviewers('likes', 1, 0, 4)
+    assert cursor == 4
+    assert reviewers + (await cache.scan_reviewers('likes', 1, cursor, 4))[1] == sorted(cache.members('likes', 1))
+    assert await cache.apply_rate('likes', 1, 'foo@example.com', False) == (1, 5)
+
+
+def test_api(memory_app):
+    for email in ('foo@example.com', 'too@example.com'):
+        response = memory_app.post('/reg', json={'first_name': 'foo', 'last_name': 'foo', 'password': 'Qwerty1234',
+                                                 'email': email})
+        assert response.status_code == 200
+    headers = {}
+    for email in ('foo@example.com', 'too@example.com'):
+        response = memory_app.post('/login/token', data={'username': email, 'password': 'Qwerty1234'})
+        headers[email] = {'Authorization': f'Bearer {response.json().get("access_token")}'}
+    response = memory_app.post('/post', json={'title': 'title', 'content': 'content'},
+                               headers=headers['foo@example.com'])
+    assert response.status_code == 200
+    assert memory_app.post('/post/1/like', headers=headers['foo@example.com']).status_code == 400
+    assert memory_app.post('/post/1/like', headers=headers['too@example.com']).json() == {'1': 1}
+    assert memory_app.post('/post/1/dis', headers=headers['too@example.com']).json() == {'detail': 'Already liked'}
+    post = memory_app.get('/post/1', headers=headers['too@example.com']).json()
+    assert (post.get('likes_count'), post.get('dislikes_count')) == (1, 0)
+    assert datetime.fromisoformat(post.get('created_at'))
+    response = memory_app.get('/post/filter?limit=5&created_since=2023-01-01T00:00:00Z',
+                              headers=headers['too@example.com'])
+    assert [post.get('post_id') for post in response.json()] == [1]
+    response = memory_app.get('/post/1/total_rate', headers=headers['too@example.com'])
+    assert response.json() == {'total_likes': 1, 'total_dislikes': 0}
+    assert memory_app.put('/post/1', json={'title': 'new', 'content': 'new'},
+                          headers=headers['too@example.com']).status_code == 403
@@ -0,0 +1,86 @@
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from main import app
+from utils.metrics import Counter, Gauge, Histogram, stats_gauge, render, timed_redis, redis_commands, \
+    redis_errors, MetricsMiddleware, http_requests
+
+
+def test_render():
+    registry = []
+    counter = Counter('foo_total', 'Foo', ('kind',), registry=registry)
+    gauge = Gauge('bar', 'Bar', registry=registry)
+    histogram = Histogram('baz_seconds', 'Baz', ('route',), buckets=(.1, 1.0), registry=registry)
+    counter.inc('a')
+    counter.inc('a', value=2)
+    counter.inc('b"')
+    gauge.inc()
+    gauge.dec(value=3)
+    histogram.observe('/post', value=.05)
+    histogram.observe('/post', value=.5)
+    histogram.observe('/post', value=5)
+    assert render(registry).splitlines() == [
+        '# HELP foo_total Foo',
+        '# TYPE foo_total counter',
+        'foo_total{kind="a"} 3',
+        'foo_total{kind="b\\""} 1',
+        '# HELP bar Bar',
+        '# TYPE bar gauge',
+        'bar -2',
+        '# HELP baz_seconds Baz',
+        '# TYPE baz_seconds histogram',
+        'baz_seconds_bucket{route="/post",le="0.1"} 1',
+        'baz_seconds_bucket{route="/post",le="1.0"} 2',
+        'baz_seconds_bucket{route="/post",le="+Inf"} 3',
+        'baz_seconds_sum{route="/post"} 5.55',
+        'baz_seconds_count{route="/post"} 3',
+    ]
+
+
+def test_stats_gauge():
+    registry = []
+    stats_gauge('pool', 'Pool', lambda: {'size': 4, 'wait_avg': .5, 'kind': 'thread'}, registry=registry)
+    assert render(registry).splitlines()[2:] == ['pool{stat="size"} 4', 'pool{stat="wait_avg"} 0.5']
+
+
+async def test_timed_redis():
+    @timed_redis
+    async def ping(fail: bool = False) -> str:
+        if fail:
+            raise ConnectionError
+        return 'pong'
+
+    assert await ping() == 'pong'
+    with pytest.raises(ConnectionError):
+        await ping(True)
+    counts, _ = redis_commands._values[('ping',)]
+    assert sum(counts) == 2
+    assert redis_errors._values[('ping',)] == 1
+
+
+def test_middleware():
+    test_app = FastAPI()
+    test_app.add_middleware(MetricsMiddleware)
+
+    @test_app.get('/items/{item_id}')
+    async def read_item(item_id: int) -> dict:
+        return {'item_id': item_id}
+
+    client = TestClient(test_app)
+    assert client.get('/items/1').status_code == 200
+    assert client.get('/items/2').status_code == 200
+    assert client.get('/items/foo').status_code == 422
+    assert client.get('/missing').status_code == 404
+    assert sum(http_requests._values[('GET', '/items/{item_id}', 200)][0]) == 2
+    assert sum(http_requests._values[('GET', '/items/{item_id}', 422)][0]) == 1
+    assert sum(http_requests._values[('GET', 'unmatched', 404)][0]) == 1
+
+
+def test_metrics_endpoint():
+    response = TestClient(app).get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    for name in ('http_request_duration_seconds', 'db_pool{stat="size"}', 'hash_pool{stat="workers"}',
+                 'token_cache{stat="hits"}'):
+        assert name in response.text
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from utils.paginations import encode_cursor, decode_cursor, Paginator, encode_rank_cursor, decode_rank_cursor, \
+    SearchPaginator, PostFilter
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2023, 7, 6, 3, 28, 33, 171803)
+    cursor = encode_cursor(created_at, 42)
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+def test_next_cursor():
+    created_at = datetime(2023, 7, 6, 3, 28, 33)
+    posts = [{'post_id': 1, 'created_at': created_at}, {'post_id': 2, 'created_at': created_at}]
+    paginator = Paginator(page=0, limit=2, cursor=None, sort='created_at', order='asc')
+    assert paginator.next_cursor(posts) == encode_cursor(created_at, 2)
+    assert Paginator(page=0, limit=3, cursor=None, sort='created_at', order='asc').next_cursor(posts) is None
+
+
+def test_sort_cursor():
+    posts = [{'post_id': 3, 'likes_count': 7}, {'post_id': 2, 'likes_count': 5}]
+    paginator = Paginator(page=0, limit=2, cursor=None, sort='likes_count', order='desc')
+    assert paginator.descending
+    cursor = paginator.next_cursor(posts)
+    assert Paginator(page=0, limit=2, cursor=cursor, sort='likes_count', order='desc').cursor == (5, 2)
+    with pytest.raises(HTTPException):
+        Paginator(page=0, limit=2, cursor=cursor, sort='created_at', order='desc')
+
+
+def test_rank_cursor():
+    rank = 0.06079271
+    assert decode_rank_cursor(encode_rank_cursor(rank, 7)) == (rank, 7)
+    posts = [{'post_id': 9, 'rank': 0.1}, {'post_id': 7, 'rank': rank}]
+    assert SearchPaginator(limit=2, cursor=None).next_cursor(posts) == encode_rank_cursor(rank, 7)
+    assert SearchPaginator(limit=3, cursor=None).next_cursor(posts) is None
+    with pytest.raises(HTTPException):
+        SearchPaginator(limit=2, cursor='W10')
+
+
+@pytest.mark.parametrize('cursor', ['broken', encode_cursor(datetime.now(), 1)[:-3], 'W10'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as e:
+        Paginator(page=0, limit=10, cursor=cursor, sort='created_at', order='asc')
+    assert e.value.status_code == 400
+
+
+def test_post_filter_local_time():
+    since = datetime(2023, 1, 1, tzinfo=timezone(timedelta(hours=3)))
+    filters = PostFilter(owner_id=None, created_since=since, created_before=datetime(2023, 1, 2), updated_since=None,
+                         updated_before=None)
+    assert filters.created_since.tzinfo is None
+    assert filters.created_since == since.astimezone().replace(tzinfo=None)
+    assert filters.created_before == datetime(2023, 1, 2)
@@ -0,0 +1,65 @@
+import time
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from utils.profiler import ProfilerMiddleware, sign_profile_request, verify_profile_request
+
+
+def busy_loop(seconds: float) -> None:
+    finish = time.perf_counter() + seconds
+    while time.perf_counter() < finish:
+        pass
+
+
+def get_client(directory, **kwargs) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(ProfilerMiddleware, directory=str(directory), interval=.001, **kwargs)
+
+    @app.get('/slow')
+    async def slow() -> dict:
+        busy_loop(.05)
+        return {}
+
+    return TestClient(app)
+
+
+def wait_for_profiles(directory, count: int) -> list:
+    for _ in range(100):
+        profiles = list(directory.iterdir())
+        if len(profiles) >= count:
+            return profiles
+        time.sleep(.01)
+    return list(directory.iterdir())
+
+
+def test_verify_profile_request():
+    expires = int(time.time()) + 60
+    assert verify_profile_request(sign_profile_request(expires))
+    assert not verify_profile_request(sign_profile_request(expires, 'other key'))
+    assert not verify_profile_request(sign_profile_request(int(time.time()) - 1))
+    assert not verify_profile_request('garbage')
+
+
+def test_signed_request(tmp_path):
+    client = get_client(tmp_path, max_fraction=1.0)
+    client.get('/slow')
+    client.get('/slow', headers={'X-Profile': 'bad.signature'})
+    assert list(tmp_path.iterdir()) == []
+    client.get('/slow', headers={'X-Profile': sign_profile_request(int(time.time()) + 60)})
+    profiles = wait_for_profiles(tmp_path, 1)
+    assert len(profiles) == 1
+    assert profiles[0].name.endswith('-GET-slow.folded')
+    lines = profiles[0].read_text().splitlines()
+    assert any('busy_loop' in line for line in lines)
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 0
+
+
+def test_max_fraction(tmp_path):
+    client = get_client(tmp_path, sample_rate=1.0, max_fraction=.25)
+    client.get('/slow')
+    assert wait_for_profiles(tmp_path, 1) == []
+    for _ in range(7):
+        client.get('/slow')
+    assert len(wait_for_profiles(tmp_path, 2)) == 2
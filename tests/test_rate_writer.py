@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from cache_redis.cache import apply_rate
+from db.db_schema import Like, Post
+from db.rate_writer import RateWriter, LeaseLost
+from settings import settings
+
+
+async def test_flush(setup_and_teardown_db, setup_and_teardown_cache, stub_user_posts, add_stub_user,
+                     monkeypatch, redis_session):
+    monkeypatch.setattr('cache_redis.cache.r', redis_session)
+    engine = create_async_engine(settings.DB_TEST)
+    monkeypatch.setattr('db.rate_writer.async_session', async_sessionmaker(engine, expire_on_commit=False))
+    writer = RateWriter('test:rates', 'test-group', batch_size=10, flush_interval=100, owner='test')
+    await writer.create_group()
+    writer.fence = await writer._hold_lock()
+    await apply_rate('likes', 1, 'foo@example.com', True, 'test:rates')
+    await apply_rate('likes', 2, 'foo@example.com', True, 'test:rates')
+    await apply_rate('likes', 2, 'foo@example.com', False, 'test:rates')
+    await redis_session.xadd('test:rates', {'rate': 'likes', 'post_id': 'broken'})
+    assert await writer.flush('>')
+    assert writer.applied == 4
+    session = setup_and_teardown_db
+    likes = await session.execute(select(Like.post_id).where(Like.reviewer == 'foo@example.com'))
+    assert likes.scalars().all() == [1]
+    counts = await session.execute(select(Post.likes_count).where(Post.post_id.in_([1, 2])).order_by(Post.post_id))
+    assert counts.scalars().all() == [1, 0]
+    assert await redis_session.xlen('test:rates') == 0
+    assert not await writer.flush('0')
+
+
+async def test_flush_stale_fence(setup_and_teardown_db, setup_and_teardown_cache, stub_user_posts, add_stub_user,
+                                 monkeypatch, redis_session):
+    monkeypatch.setattr('cache_redis.cache.r', redis_session)
+    engine = create_async_engine(settings.DB_TEST)
+    monkeypatch.setattr('db.rate_writer.async_session', async_sessionmaker(engine, expire_on_commit=False))
+    stale = RateWriter('test:rates', 'test-group', batch_size=10, flush_interval=100, owner='stale')
+    await stale.create_group()
+    stale.fence = await stale._hold_lock()
+    await redis_session.delete(stale.lock)  # the lease expired during a long pause
+    writer = RateWriter('test:rates', 'test-group', batch_size=10, flush_interval=100, owner='test')
+    writer.fence = await writer._hold_lock()
+    assert writer.fence > stale.fence
+    await apply_rate('likes', 1, 'foo@example.com', True, 'test:rates')
+    assert await writer.flush('>')
+    await apply_rate('likes', 2, 'foo@example.com', True, 'test:rates')
+    with pytest.raises(LeaseLost):
+        await stale.flush('>')
+    session = setup_and_teardown_db
+    likes = await session.execute(select(Like.post_id).where(Like.reviewer == 'foo@example.com'))
+    assert likes.scalars().all() == [1]
+    assert await redis_session.xlen('test:rates') == 1
+
+
+async def test_run_survives_errors(monkeypatch):
+    writer = RateWriter('test:rates', 'test-group', batch_size=10, flush_interval=1, owner='test')
+    calls = []
+
+    async def hold_lock() -> int:
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionRefusedError()
+        writer._stopping.set()
+        return 0
+
+    monkeypatch.setattr(writer, '_hold_lock', hold_lock)
+    await writer.run()
+    assert len(calls) == 3
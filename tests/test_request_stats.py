@@ -0,0 +1,53 @@
+import json
+import logging
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from utils.request_stats import RequestStatsMiddleware, RequestStats, request_stats, record_db, record_redis
+
+
+def get_app(budget: int) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestStatsMiddleware, budget=budget)
+
+    @app.get('/posts/{post_id}')
+    async def read_post(post_id: int) -> dict:
+        for _ in range(post_id):
+            record_db(.002)
+        record_redis(.001)
+        return {'post_id': post_id}
+
+    return app
+
+
+def test_record_outside_request():
+    record_db(.1)
+    record_redis(.1)
+    assert request_stats.get() is None
+
+
+def test_server_timing():
+    stats = RequestStats()
+    stats.db_count, stats.db_time = 2, .0125
+    assert stats.server_timing().startswith('db;desc="2 queries";dur=12.5, redis;desc="0 calls";dur=0.0, app;dur=')
+
+
+def test_middleware(caplog):
+    client = TestClient(get_app(budget=3))
+    with caplog.at_level(logging.INFO, logger='request'):
+        response = client.get('/posts/2')
+    assert response.headers['server-timing'].startswith('db;desc="2 queries";dur=4.0, redis;desc="1 calls";dur=1.0')
+    record = json.loads(caplog.records[-1].message)
+    assert caplog.records[-1].levelno == logging.INFO
+    assert (record['route'], record['status']) == ('/posts/{post_id}', 200)
+    assert (record['db_count'], record['redis_count']) == (2, 1)
+    assert record['over_budget'] is False
+
+
+def test_middleware_over_budget(caplog):
+    client = TestClient(get_app(budget=3))
+    with caplog.at_level(logging.INFO, logger='request'):
+        client.get('/posts/5')
+    assert caplog.records[-1].levelno == logging.WARNING
+    assert json.loads(caplog.records[-1].message)['over_budget'] is True
@@ -0,0 +1,19 @@
+import json
+import uuid
+from datetime import datetime
+
+from utils.streaming import ndjson
+
+
+async def test_ndjson():
+    user_id = uuid.uuid4()
+    created_at = datetime(2023, 7, 6, 3, 28, 33)
+
+    async def rows():
+        for post_id in (1, 2):
+            yield {'post_id': post_id, 'owner_id': user_id, 'created_at': created_at}
+
+    lines = [line async for line in ndjson(rows())]
+    assert len(lines) == 2
+    assert all(line.endswith(b'\n') for line in lines)
+    assert json.loads(lines[1]) == {'post_id': 2, 'owner_id': str(user_id), 'created_at': '2023-07-06T03:28:33'}
@@ -0,0 +1,37 @@
+import time
+
+from utils.ttl_cache import TTLCache
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1}
+
+
+def test_ttl_expire(monkeypatch):
+    now = time.monotonic()
+    cache = TTLCache(maxsize=10, ttl=30)
+    monkeypatch.setattr('utils.ttl_cache.time.monotonic', lambda: now)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=5)
+    monkeypatch.setattr('utils.ttl_cache.time.monotonic', lambda: now + 10)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    monkeypatch.setattr('utils.ttl_cache.time.monotonic', lambda: now + 31)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_pop():
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set('a', 1)
+    cache.pop('a')
+    cache.pop('missing')
+    assert cache.get('a') is None
@@ -0,0 +1,35 @@
+import asyncio
+import logging
+import time
+
+from utils.watchdog import LoopWatchdog, loop_blocks
+
+
+async def blocking_handler() -> None:
+    time.sleep(.3)
+
+
+async def test_watchdog(caplog):
+    watchdog = LoopWatchdog(threshold=.1, interval=.02, log_interval=60)
+    await watchdog.start()
+    with caplog.at_level(logging.WARNING, logger='watchdog'):
+        await asyncio.sleep(.05)
+        await asyncio.create_task(blocking_handler())
+        await asyncio.sleep(.05)
+        await asyncio.create_task(blocking_handler())
+        await asyncio.sleep(.05)
+    await watchdog.stop()
+    assert watchdog.blocks == 2
+    assert watchdog.suppressed == 1
+    assert watchdog.max_lag >= .2
+    assert loop_blocks._values[('blocking_handler (test_watchdog.py:9)',)] >= 2
+    assert len(caplog.records) == 1
+    assert 'in blocking_handler (test_watchdog.py:9)' in caplog.records[0].message
+    assert 'time.sleep(.3)' in caplog.records[0].message
+
+
+async def test_watchdog_disabled():
+    watchdog = LoopWatchdog(threshold=0, interval=.02, log_interval=60)
+    await watchdog.start()
+    await watchdog.stop()
+    assert watchdog.stats() == {'blocks': 0, 'suppressed': 0, 'max_lag': 0.0}
@@ -1,13 +1,13 @@
-from typing import Optional
-
 from fastapi import HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from auth_backend.authenticate import decode_token
-from cache_redis.cache import add_rate, check_exists_rate, remove_rate
+from auth_backend.authenticate import decode_token, principal_from_claims, CLAIMS_VERSION
+from cache_redis.cache import OPPOSITE_RATE
 from db.db_config import get_db
-from db.db_services import UserManager, PostManager
+from db.db_schema import Like, Dislike
+from settings import settings
+from storage import UserManager, PostManager, apply_rate
 from models import UserToken
 
 already_liked = HTTPException(
@@ -33,92 +33,58 @@ do_not_dis_bef = HTTPException(
     detail=f"You haven\'t disliked it before'\t exists"
 )
 
+RATE_MODELS = {'likes': Like, 'dis': Dislike}
+already_rated = {'likes': already_liked, 'dis': already_disliked}
+not_rated_before = {'likes': do_not_liked_bef, 'dis': do_not_dis_bef}
+
 
 async def is_owner(token: dict, post_id: int, db: AsyncSession) -> tuple[str, bool]:
-    email = token.get('email')
-    user = await UserManager(db).get(UserToken(email=email))
     post = await PostManager(db).get(post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post {post_id} doesn'\t exists"
         )
-    if not user.get('user_id') == post.get('owner_id') and not user.get('is_admin'):
+    if not token.get('user_id') == post.get('owner_id') and not token.get('is_admin'):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"You haven\'t permission for modify {post_id}"
         )
-    return user.get('user_id'), user.get('is_admin')
+    return token.get('user_id'), token.get('is_admin')
 
 
 async def get_user_by_token(token: str, db: AsyncSession = Depends(get_db)) -> str:
     payload = decode_token(token)
+    if payload.get('ver') == CLAIMS_VERSION:
+        return principal_from_claims(payload).get('user_id')
     email = payload.get('sub')
     user = await UserManager(db).get(UserToken(email=email))
     return user.get('user_id')
 
 
-async def check_like(user: dict, post_id: int, db: AsyncSession) -> Optional[str]:
-    email = user.get('email')
-    user = await UserManager(db).get(UserToken(email=email))
-    post = await PostManager(db).get(post_id)
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post {post_id} doesn'\t exists"
-        )
-    if user.get('user_id') == post.get('owner_id'):  # owner of post
-        raise post_owner
-    already_dis = check_exists_rate('dis', post_id, email)
-    if already_dis:
-        raise already_disliked
-    added = add_rate('likes', post_id, email)  # already liked
-    if not added:
-        raise already_liked
-    return email
-
-
-async def check_dislike(user: dict, post_id: int, db: AsyncSession) -> Optional[str]:
-    email = user.get('email')
-    user = await UserManager(db).get(UserToken(email=email))
-    post = await PostManager(db).get(post_id)
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post {post_id} doesn'\t exists"
-        )
-    if user.get('user_id') == post.get('owner_id'):  # owner of post
-        raise post_owner
-    already_like = check_exists_rate('likes', post_id, email)
-    if already_like:
-        raise already_liked
-    added = add_rate('dis', post_id, email)  # already disliked
-    if not added:
-        raise already_disliked
-    return email
-
-
-async def check_like_for_del(user: dict, post_id: int, db: AsyncSession = Depends(get_db)) -> Optional[str]:
+async def rate_post(user: dict, post_id: int, rate_type: str, add: bool, db: AsyncSession) -> int:
+    if settings.RATE_WRITE_BEHIND:
+        return await rate_post_behind(user, post_id, rate_type, add, db)
     email = user.get('email')
-    user = await UserManager(db).get(UserToken(email=email))
-    post = await PostManager(db).get(post_id)
-    if not post:
+    user_id = user.get('user_id')
+    result = await PostManager(db).rate(RATE_MODELS[rate_type], email, post_id, add, user_id)
+    if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post {post_id} doesn'\t exists"
         )
-    if user.get('user_id') == post.get('owner_id'):  # owner of post
+    if result.get('owner_id') == user_id:  # owner of post
         raise post_owner
-    already_like = check_exists_rate('likes', post_id, email)
-    if not already_like:
-        raise do_not_liked_bef
-    remove_rate('likes', post_id, email)
-    return email
+    if not result.get('changed'):
+        raise already_rated[rate_type] if add else not_rated_before[rate_type]
+    changed, _ = await apply_rate(rate_type, post_id, email, add)
+    if changed < 0:  # rated the opposite way, the transaction is rolled back
+        raise already_rated[OPPOSITE_RATE[rate_type]]
+    return result.get('total')
 
 
-async def check_dis_for_del(user: dict, post_id: int, db: AsyncSession = Depends(get_db)) -> Optional[str]:
+async def rate_post_behind(user: dict, post_id: int, rate_type: str, add: bool, db: AsyncSession) -> int:
     email = user.get('email')
-    user = await UserManager(db).get(UserToken(email=email))
     post = await PostManager(db).get(post_id)
     if not post:
         raise HTTPException(
@@ -127,8 +93,9 @@ async def check_dis_for_del(user: dict, post_id: int, db: AsyncSession = Depends
         )
     if user.get('user_id') == post.get('owner_id'):  # owner of post
         raise post_owner
-    already_dis = check_exists_rate('dis', post_id, email)
-    if not already_dis:
-        raise do_not_dis_bef
-    remove_rate('dis', post_id, email)
-    return email
+    changed, total = await apply_rate(rate_type, post_id, email, add, settings.RATE_STREAM)
+    if changed < 0:
+        raise already_rated[OPPOSITE_RATE[rate_type]]
+    if not changed:
+        raise already_rated[rate_type] if add else not_rated_before[rate_type]
+    return total
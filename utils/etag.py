@@ -0,0 +1,28 @@
+import hashlib
+from starlette.requests import Request
+
+
+def post_etag(post: dict) -> str:
+    stamp = f"{post.get('post_id')}:{post.get('update_at').isoformat()}:" \
+            f"{post.get('likes_count')}:{post.get('dislikes_count')}"
+    return f'"{hashlib.blake2b(stamp.encode(), digest_size=16).hexdigest()}"'
+
+
+def list_etag(posts: list[dict]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for post in posts:
+        digest.update(post_etag(post).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def is_conditional(request: Request) -> bool:
+    return 'if-none-match' in request.headers
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    # no Last-Modified/If-Modified-Since: ratings change the counters without touching update_at
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in tags or '*' in tags
@@ -1,4 +1,10 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
 import bcrypt
+from settings import settings
 
 
 def hash_pass(password: str) -> str:
@@ -9,3 +15,82 @@ def hash_pass(password: str) -> str:
 
 def check_hash(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+class HashPoolSaturated(Exception):
+    pass
+
+
+def _timed_call(func: Callable, *args) -> tuple[float, float, object]:
+    started = time.time()
+    result = func(*args)
+    return started, time.time(), result
+
+
+class HashService:
+    def __init__(self, kind: str = 'thread', workers: Optional[int] = None, queue_limit: int = 0):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = queue_limit
+        self._executor: Optional[Executor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hasher')
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _submit(self, func: Callable, *args):
+        if self.in_flight >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HashPoolSaturated('Password hashing pool is saturated')
+        self.in_flight += 1
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            started, finished, result = await loop.run_in_executor(self.executor, _timed_call, func, *args)
+        finally:
+            self.in_flight -= 1
+        wait = max(started - submitted, 0.0)
+        self.completed += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.run_total += finished - started
+        return result
+
+    async def hash_pass(self, password: str) -> str:
+        return await self._submit(hash_pass, password)
+
+    async def check_hash(self, password: str, hashed: str) -> bool:
+        return await self._submit(check_hash, password, hashed)
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'in_flight': self.in_flight,
+            'queued': max(self.in_flight - self.workers, 0),
+            'utilisation': min(self.in_flight, self.workers) / self.workers,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_avg': self.wait_total / self.completed if self.completed else 0.0,
+            'wait_max': self.wait_max,
+            'run_avg': self.run_total / self.completed if self.completed else 0.0,
+        }
+
+
+hash_service = HashService(settings.HASH_EXECUTOR, settings.HASH_WORKERS, settings.HASH_QUEUE_LIMIT)
@@ -0,0 +1,173 @@
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Iterable, Optional
+from utils.request_stats import route_template, record_redis
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), registry: Optional[list] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, object] = {}
+        (REGISTRY if registry is None else registry).append(self)
+
+    def header(self) -> list[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def samples(self) -> list[str]:
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+                for labels, value in self._values.items()]
+
+    def render(self) -> list[str]:
+        return self.header() + self.samples()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, value: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, *labels, value: float) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels, value: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def dec(self, *labels, value: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - value
+
+
+class GaugeFunc(Metric):
+    # values are collected only when /metrics is scraped
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...], func: Callable[[], dict],
+                 registry: Optional[list] = None):
+        super().__init__(name, help, labelnames, registry)
+        self.func = func
+
+    def samples(self) -> list[str]:
+        self._values = {labels: value for labels, value in self.func().items()
+                        if isinstance(value, (int, float)) and not isinstance(value, bool)}
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS, registry: Optional[list] = None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = buckets
+
+    def observe(self, *labels, value: float) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _labels(self.labelnames + ('le',), labels + (_number(bound),))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+REGISTRY: list[Metric] = []
+
+
+def render(registry: Optional[list[Metric]] = None) -> str:
+    lines = []
+    for metric in REGISTRY if registry is None else registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def stats_gauge(name: str, help: str, stats: Callable[[], dict], registry: Optional[list] = None) -> GaugeFunc:
+    return GaugeFunc(name, help, ('stat',), lambda: {(key,): value for key, value in stats().items()}, registry)
+
+
+http_requests = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template', ('method', 'route', 'status'))
+http_in_flight = Gauge('http_requests_in_flight', 'HTTP requests being served', ('method',))
+db_queries = Histogram('db_query_duration_seconds', 'SQL statement latency by statement type', ('statement',))
+db_errors = Counter('db_query_errors_total', 'Failed SQL statements by statement type', ('statement',))
+redis_commands = Histogram('redis_command_duration_seconds', 'Redis call latency by cache function', ('command',))
+redis_errors = Counter('redis_command_errors_total', 'Failed Redis calls by cache function', ('command',))
+
+
+def timed_redis(func: Callable) -> Callable:
+    command = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            redis_errors.inc(command)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            redis_commands.observe(command, value=duration)
+            record_redis(duration)
+    return wrapper
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        method = scope['method']
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        http_in_flight.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(method)
+            http_requests.observe(method, route_template(scope), status_code,
+                                  value=time.perf_counter() - started)
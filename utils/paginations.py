@@ -1,7 +1,103 @@
-from fastapi import Query
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Union
+from uuid import UUID
+from fastapi import Query, HTTPException
+from starlette import status
+
+
+def _encode(values: list) -> str:
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode(cursor: str) -> list:
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    return json.loads(raw)
+
+
+def encode_cursor(value: Union[datetime, int], post_id: int) -> str:
+    return _encode([value.isoformat() if isinstance(value, datetime) else value, post_id])
+
+
+def decode_cursor(cursor: str, sort: str = 'created_at') -> tuple[Union[datetime, int], int]:
+    value, post_id = _decode(cursor)
+    if sort == 'likes_count':
+        return int(value), int(post_id)
+    return datetime.fromisoformat(value), int(post_id)
+
+
+def encode_rank_cursor(rank: float, post_id: int) -> str:
+    return _encode([rank, post_id])
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    rank, post_id = _decode(cursor)
+    return float(rank), int(post_id)
+
+
+def local_time(value: Optional[datetime]) -> Optional[datetime]:
+    # created_at and update_at are naive server local times
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
 
 
 class Paginator:
-    def __init__(self, page: int = Query(ge=0, default=0), limit: int = Query(ge=1, le=100)):
+    def __init__(self, page: int = Query(ge=0, default=0), limit: int = Query(ge=1, le=100),
+                 cursor: Optional[str] = Query(default=None),
+                 sort: str = Query(default='created_at', regex='^(created_at|update_at|likes_count)$'),
+                 order: str = Query(default='asc', regex='^(asc|desc)$')):
         self.page = page
         self.limit = limit
+        self.sort = sort
+        self.descending = order == 'desc'
+        self.cursor = None
+        if cursor:
+            try:
+                self.cursor = decode_cursor(cursor, sort)
+            except (ValueError, TypeError):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail='Invalid cursor'
+                )
+
+    def next_cursor(self, posts: list[dict]) -> Optional[str]:
+        if len(posts) < self.limit:
+            return None
+        last = posts[-1]
+        return encode_cursor(last.get(self.sort), last.get('post_id'))
+
+
+class PostFilter:
+    def __init__(self, owner_id: Optional[UUID] = Query(default=None),
+                 created_since: Optional[datetime] = Query(default=None),
+                 created_before: Optional[datetime] = Query(default=None),
+                 updated_since: Optional[datetime] = Query(default=None),
+                 updated_before: Optional[datetime] = Query(default=None)):
+        self.owner_id = owner_id
+        self.created_since = local_time(created_since)
+        self.created_before = local_time(created_before)
+        self.updated_since = local_time(updated_since)
+        self.updated_before = local_time(updated_before)
+
+
+class SearchPaginator:
+    def __init__(self, limit: int = Query(ge=1, le=100, default=20), cursor: Optional[str] = Query(default=None)):
+        self.limit = limit
+        self.cursor = None
+        if cursor:
+            try:
+                self.cursor = decode_rank_cursor(cursor)
+            except (ValueError, TypeError):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail='Invalid cursor'
+                )
+
+    def next_cursor(self, posts: list[dict]) -> Optional[str]:
+        if len(posts) < self.limit:
+            return None
+        last = posts[-1]
+        return encode_rank_cursor(last.get('rank'), last.get('post_id'))
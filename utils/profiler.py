@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from settings import settings
+
+
+def sign_profile_request(expires: int, key: str = settings.SECRET_KEY) -> str:
+    digest = hmac.new(key.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f'{expires}.{digest}'
+
+
+def verify_profile_request(value: str, key: str = settings.SECRET_KEY) -> bool:
+    expires, _, _ = value.partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(value, sign_profile_request(int(expires), key))
+
+
+def fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def runs(frame, target) -> bool:
+    while frame is not None:
+        if frame is target:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class Sampler(threading.Thread):
+    def __init__(self, path: str, interval: float, task: asyncio.Task):
+        super().__init__(name='profiler', daemon=True)
+        self.path = path
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.task_frame = task.get_coro().cr_frame
+        self.stacks: Counter[str] = Counter()
+        self.finished = threading.Event()
+
+    def run(self) -> None:
+        # other requests share the loop thread, a sample is only kept while it is inside the profiled task's coroutine
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if runs(frame, self.task_frame):
+                self.stacks[fold(frame)] += 1
+        if self.stacks:
+            with open(self.path, 'w') as file:
+                file.writelines(f'{stack} {count}\n' for stack, count in self.stacks.items())
+
+    def stop(self) -> None:
+        self.finished.set()
+
+
+class ProfilerMiddleware:
+    def __init__(self, app, directory: Optional[str] = settings.PROFILE_DIR,
+                 sample_rate: float = settings.PROFILE_SAMPLE_RATE, max_fraction: float = settings.PROFILE_MAX_FRACTION,
+                 interval: float = settings.PROFILE_INTERVAL, header: str = settings.PROFILE_HEADER):
+        self.app = app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_fraction = max_fraction
+        self.interval = interval
+        self.header = header.lower().encode()
+        self.requests = 0
+        self.profiled = 0
+        self.active = False
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def should_profile(self, scope: dict) -> bool:
+        self.requests += 1
+        # counts the request being decided, so even the first one is refused unless it stays under the cap
+        if self.active or self.profiled + 1 > self.max_fraction * self.requests:
+            return False
+        signature = next((value for name, value in scope['headers'] if name == self.header), None)
+        if signature is not None:
+            return verify_profile_request(signature.decode('latin-1'))
+        return random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.directory or not self.should_profile(scope):
+            return await self.app(scope, receive, send)
+        self.active = True
+        self.profiled += 1
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', scope['path']).strip('_') or 'root'
+        path = os.path.join(self.directory, f'{time.time_ns()}-{scope["method"]}-{name}.folded')
+        sampler = Sampler(path, self.interval, asyncio.current_task())
+        sampler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.stop()
+            self.active = False
+
+    def stats(self) -> dict:
+        return {'requests': self.requests, 'profiled': self.profiled, 'active': int(self.active)}
@@ -0,0 +1,102 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+import orjson
+from settings import settings
+
+logger = logging.getLogger('request')
+
+
+def route_template(scope: dict) -> str:
+    app = scope['app']
+    templates = getattr(app.state, 'route_templates', None)
+    if templates is None:
+        templates = app.state.route_templates = {
+            route.endpoint: route.path for route in app.routes if hasattr(route, 'endpoint')
+        }
+    return templates.get(scope.get('endpoint'), 'unmatched')
+
+
+class RequestStats:
+    __slots__ = ('started', 'db_count', 'db_time', 'redis_count', 'redis_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.redis_count = 0
+        self.redis_time = 0.0
+
+    @property
+    def roundtrips(self) -> int:
+        return self.db_count + self.redis_count
+
+    def server_timing(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        return (f'db;desc="{self.db_count} queries";dur={self.db_time * 1000:.1f}, '
+                f'redis;desc="{self.redis_count} calls";dur={self.redis_time * 1000:.1f}, '
+                f'app;dur={elapsed * 1000:.1f}')
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def record_db(duration: float) -> None:
+    stats = request_stats.get()
+    if stats is not None:
+        stats.db_count += 1
+        stats.db_time += duration
+
+
+def record_redis(duration: float) -> None:
+    stats = request_stats.get()
+    if stats is not None:
+        stats.redis_count += 1
+        stats.redis_time += duration
+
+
+class RequestStatsMiddleware:
+    def __init__(self, app, budget: int = settings.REQUEST_ROUNDTRIP_BUDGET):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                headers = list(message.get('headers', ()))
+                headers.append((b'server-timing', stats.server_timing().encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_stats.reset(token)
+            self.log(scope, status_code, stats)
+
+    def log(self, scope: dict, status_code: int, stats: RequestStats) -> None:
+        over_budget = 0 < self.budget < stats.roundtrips
+        level = logging.WARNING if over_budget else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        logger.log(level, orjson.dumps({
+            'method': scope['method'],
+            'path': scope['path'],
+            'route': route_template(scope),
+            'status': status_code,
+            'duration_ms': round((time.perf_counter() - stats.started) * 1000, 3),
+            'db_count': stats.db_count,
+            'db_ms': round(stats.db_time * 1000, 3),
+            'redis_count': stats.redis_count,
+            'redis_ms': round(stats.redis_time * 1000, 3),
+            'over_budget': over_budget,
+        }).decode())
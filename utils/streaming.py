@@ -0,0 +1,7 @@
+from typing import AsyncIterator
+import orjson
+
+
+async def ndjson(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    async for row in rows:
+        yield orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
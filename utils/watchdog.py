@@ -0,0 +1,116 @@
+import asyncio
+import contextlib
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from typing import Optional
+from settings import settings
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger('watchdog')
+
+loop_lag = Histogram('event_loop_lag_seconds', 'Delay of the event loop heartbeat')
+loop_blocks = Counter('event_loop_blocks_total', 'Event loop stalls over the threshold by blocking call site',
+                      ('site',))
+
+LIBRARY_PATHS = tuple({sysconfig.get_paths()[name] for name in ('stdlib', 'platstdlib', 'purelib', 'platlib')})
+
+
+def task_name(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return 'callback'
+    coro = task.get_coro()
+    return getattr(coro, '__qualname__', None) or task.get_name()
+
+
+def call_site(frame) -> Optional[str]:
+    # the innermost frame outside the standard library and installed packages is the code that blocked
+    while frame is not None:
+        code = frame.f_code
+        if not code.co_filename.startswith(('<', *LIBRARY_PATHS)):
+            return f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+        frame = frame.f_back
+    return None
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float, interval: float, log_interval: float):
+        self.threshold = threshold
+        self.interval = interval
+        self.log_interval = log_interval
+        self.beat = 0.0
+        self.blocks = 0
+        self.suppressed = 0
+        self.max_lag = 0.0
+        self.last_log = float('-inf')
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def start(self) -> None:
+        if self.threshold <= 0 or self._task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self.heartbeat(), name='loop-watchdog')
+        self._thread = threading.Thread(target=self.monitor, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        await asyncio.to_thread(self._thread.join)
+        self._task, self._thread = None, None
+
+    async def heartbeat(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.beat = time.perf_counter()
+            lag = max(self.beat - expected, 0.0)
+            self.max_lag = max(self.max_lag, lag)
+            loop_lag.observe(value=lag)
+
+    def monitor(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.interval / 2):
+            beat = self.beat
+            blocked = time.perf_counter() - beat - self.interval
+            if blocked > self.threshold and beat != reported:  # one report per stall
+                reported = beat
+                self.report(blocked)
+
+    def report(self, blocked: float) -> None:
+        # read from the watchdog thread while the loop is stuck, so the stack is the blocking call site
+        frame = sys._current_frames().get(self.thread_id)
+        name = call_site(frame) or task_name(asyncio.current_task(self.loop))
+        self.blocks += 1
+        loop_blocks.inc(name)
+        now = time.monotonic()
+        if now - self.last_log < self.log_interval:
+            self.suppressed += 1
+            return
+        self.last_log = now
+        stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+        logger.warning('Event loop blocked for more than %.3fs in %s (%d reports suppressed)\n%s',
+                       blocked, name, self.suppressed, stack)
+        self.suppressed = 0
+
+    def stats(self) -> dict:
+        return {'blocks': self.blocks, 'suppressed': self.suppressed, 'max_lag': self.max_lag}
+
+
+loop_watchdog = LoopWatchdog(settings.LOOP_WATCHDOG_THRESHOLD, settings.LOOP_WATCHDOG_INTERVAL,
+                             settings.LOOP_WATCHDOG_LOG_INTERVAL)